@@ -0,0 +1,365 @@
+"""
+MiFlasher ADB Client
+Talks to the local adb server (port 5037) directly instead of spawning `adb`
+for every command: host:devices, host:transport, shell (v2, with exit codes),
+reboot, device tracking, and sync push / pull / stat.
+
+Host and shell services consume their connection by protocol design; sync
+sessions are kept open and reused per serial, so repeated pulls during a
+backup share one connection.
+"""
+
+import os
+import socket
+import struct
+import subprocess
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+
+ADB_PORT = int(os.environ.get("ANDROID_ADB_SERVER_PORT", "5037"))
+
+# shell v2 packet ids
+SHELL_STDOUT = 1
+SHELL_STDERR = 2
+SHELL_EXIT   = 3
+
+
+class AdbError(Exception):
+    """The adb server or device answered FAIL, or the connection broke."""
+
+
+class _Closed(AdbError):
+    """The adb server closed the connection."""
+
+
+class _StaleSync(AdbError):
+    """A pooled sync session had broken; the operation may be retried on a fresh one."""
+
+
+def adb_mode(state: str) -> Optional[str]:
+    """MiFlasher mode for an adb device state: recovery | adb (None for offline)."""
+    if state == "offline":
+        return None
+    # state: device | recovery | sideload | unauthorized
+    return "recovery" if state == "recovery" else "adb"
+
+
+def _recv_exact(sock: socket.socket, n: int) -> bytes:
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise _Closed("Connection closed by adb server")
+        buf += chunk
+    return bytes(buf)
+
+
+class AdbClient:
+
+    SYNC_DATA_MAX = 64 * 1024    # protocol limit for one sync DATA packet
+    POOL_MAX      = 2            # idle sync sessions kept per serial
+
+    _shared      = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, host: str = "127.0.0.1", port: int = ADB_PORT, timeout: float = 10):
+        self.host    = host
+        self.port    = port
+        self.timeout = timeout
+        self._pool: Dict[str, List[socket.socket]] = {}
+        self._lock    = threading.Lock()
+        self._started = False
+
+    @classmethod
+    def shared(cls) -> "AdbClient":
+        """Process-wide client, so every caller shares the sync pool."""
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    # ── Wire helpers ──────────────────────────────────────────────────────────
+
+    def _connect(self) -> socket.socket:
+        try:
+            return socket.create_connection((self.host, self.port), timeout=self.timeout)
+        except ConnectionRefusedError:
+            if self._started:
+                raise
+            # Same as the adb CLI: start the server on first use, then retry
+            self._started = True
+            try:
+                subprocess.run(["adb", "start-server"], capture_output=True, timeout=15)
+            except FileNotFoundError:
+                raise AdbError("adb server is not running and the adb binary was not found")
+            except subprocess.TimeoutExpired:
+                raise AdbError("adb start-server timed out")
+            return socket.create_connection((self.host, self.port), timeout=self.timeout)
+
+    @staticmethod
+    def _read_string(sock: socket.socket) -> str:
+        n = int(_recv_exact(sock, 4), 16)
+        return _recv_exact(sock, n).decode("utf-8", "replace")
+
+    def _request(self, sock: socket.socket, req: str):
+        """Send one smart-socket request ("%04x" length + payload) and expect OKAY."""
+        data = req.encode()
+        sock.sendall(b"%04x" % len(data) + data)
+        status = _recv_exact(sock, 4)
+        if status == b"FAIL":
+            raise AdbError(self._read_string(sock))
+        if status != b"OKAY":
+            raise AdbError(f"Unexpected reply to {req}: {status!r}")
+
+    def _transport(self, serial: Optional[str]) -> socket.socket:
+        """New connection bound to one device (any device when serial is None)."""
+        sock = self._connect()
+        try:
+            self._request(sock, f"host:transport:{serial}" if serial else "host:transport-any")
+        except Exception:
+            sock.close()
+            raise
+        return sock
+
+    # ── Host services ─────────────────────────────────────────────────────────
+
+    def version(self) -> int:
+        with self._connect() as sock:
+            self._request(sock, "host:version")
+            return int(self._read_string(sock), 16)
+
+    def devices(self) -> List[Tuple[str, str]]:
+        """(serial, state) for every device the server knows — state: device | recovery | ..."""
+        with self._connect() as sock:
+            self._request(sock, "host:devices")
+            out = self._read_string(sock)
+        return self._parse_devices(out)
+
+    @staticmethod
+    def _parse_devices(out: str) -> List[Tuple[str, str]]:
+        return [tuple(line.split("\t", 1)) for line in out.splitlines() if "\t" in line]
+
+    def track_devices(self, on_open=None) -> Iterator[List[Tuple[str, str]]]:
+        """
+        host:track-devices — yields the full (serial, state) list now and again
+        every time it changes. Blocks between updates; `on_open(sock)` receives
+        the socket so another thread can close it to stop the stream.
+        """
+        sock = self._connect()
+        try:
+            sock.settimeout(None)
+            if on_open:
+                on_open(sock)
+            self._request(sock, "host:track-devices")
+            while True:
+                yield self._parse_devices(self._read_string(sock))
+        finally:
+            sock.close()
+
+    # ── Device services ───────────────────────────────────────────────────────
+
+    def shell(self, serial: Optional[str], cmd: str,
+              timeout: Optional[float] = None) -> Tuple[int, str]:
+        """
+        Run a shell command; returns (exit code, stdout + stderr). `timeout` is
+        how long the command may go without output (default: the client's).
+        """
+        sock = self._transport(serial)
+        try:
+            try:
+                self._request(sock, f"shell,v2,raw:{cmd}")
+            except AdbError:
+                # device without shell v2: legacy shell, exit code unknown
+                sock.close()
+                sock = self._transport(serial)
+                self._request(sock, f"shell:{cmd}")
+                if timeout is not None:
+                    sock.settimeout(timeout)
+                out = bytearray()
+                while True:
+                    chunk = sock.recv(65536)
+                    if not chunk:
+                        return 0, out.decode("utf-8", "replace")
+                    out += chunk
+
+            if timeout is not None:
+                sock.settimeout(timeout)
+            out = bytearray()
+            while True:
+                try:
+                    kind, n = struct.unpack("<BI", _recv_exact(sock, 5))
+                    data = _recv_exact(sock, n)
+                except _Closed:
+                    raise AdbError(f"Shell closed before reporting an exit status: {cmd}")
+                if kind in (SHELL_STDOUT, SHELL_STDERR):
+                    out += data
+                elif kind == SHELL_EXIT:
+                    return (data[0] if data else 0), out.decode("utf-8", "replace")
+        finally:
+            sock.close()
+
+    def reboot(self, serial: Optional[str], target: str = ""):
+        """target: "" (system) | bootloader | recovery | fastboot | sideload | edl."""
+        with self._transport(serial) as sock:
+            self._request(sock, f"reboot:{target}")
+
+    # ── Sync (push / pull) ────────────────────────────────────────────────────
+
+    @staticmethod
+    def _alive(sock: socket.socket) -> bool:
+        """An idle sync session has nothing to read; EOF or stray bytes mean it is unusable."""
+        timeout = sock.gettimeout()
+        try:
+            sock.setblocking(False)
+            sock.recv(1, socket.MSG_PEEK)
+            return False
+        except BlockingIOError:
+            return True
+        except OSError:
+            return False
+        finally:
+            sock.settimeout(timeout)
+
+    @contextmanager
+    def _sync(self, serial: Optional[str], fresh: bool = False):
+        """
+        A sync session from the pool (or a new one); returned to the pool if it
+        stays healthy. When a pooled session fails, _StaleSync is raised so the
+        caller can retry once with fresh=True.
+        """
+        key  = serial or ""
+        sock = None
+        while not fresh and sock is None:
+            with self._lock:
+                idle = self._pool.get(key, [])
+                sock = idle.pop() if idle else None
+            if sock is None:
+                break
+            if not self._alive(sock):
+                sock.close()
+                sock = None
+        pooled = sock is not None
+        if sock is None:
+            sock = self._transport(serial)
+            try:
+                self._request(sock, "sync:")
+            except Exception:
+                sock.close()
+                raise
+        try:
+            yield sock
+        except (_Closed, ConnectionError) as e:
+            sock.close()
+            if pooled:
+                raise _StaleSync(str(e)) from e
+            raise
+        except BaseException:
+            sock.close()
+            raise
+        with self._lock:
+            idle = self._pool.setdefault(key, [])
+            if len(idle) < self.POOL_MAX:
+                idle.append(sock)
+                return
+        sock.close()
+
+    @staticmethod
+    def _sync_send(sock: socket.socket, cmd: bytes, data: bytes):
+        sock.sendall(cmd + struct.pack("<I", len(data)) + data)
+
+    @staticmethod
+    def _sync_reply(sock: socket.socket) -> Tuple[bytes, int]:
+        head = _recv_exact(sock, 8)
+        return head[:4], struct.unpack("<I", head[4:])[0]
+
+    def stat(self, serial: Optional[str], remote: str) -> Optional[Tuple[int, int, int]]:
+        """(mode, size, mtime) of a device path, or None when it doesn't exist."""
+        try:
+            return self._stat(serial, remote)
+        except _StaleSync:
+            return self._stat(serial, remote, fresh=True)
+
+    def _stat(self, serial: Optional[str], remote: str,
+              fresh: bool = False) -> Optional[Tuple[int, int, int]]:
+        with self._sync(serial, fresh) as sock:
+            self._sync_send(sock, b"STAT", remote.encode())
+            reply = _recv_exact(sock, 16)
+            if reply[:4] != b"STAT":
+                raise AdbError(f"Unexpected STAT reply: {reply[:4]!r}")
+        mode, size, mtime = struct.unpack("<III", reply[4:])
+        return (mode, size, mtime) if mode else None
+
+    def pull(self, serial: Optional[str], remote: str, local: str,
+             progress: Optional[Callable[[int], None]] = None) -> int:
+        """
+        Copy a device file to `local`; returns bytes written. `progress(n)`
+        follows each packet.
+        """
+        written = [0]
+        try:
+            return self._pull(serial, remote, local, progress, written)
+        except _StaleSync:
+            if written[0]:
+                raise   # progress was already reported; don't count it twice
+            return self._pull(serial, remote, local, progress, written, fresh=True)
+
+    def _pull(self, serial: Optional[str], remote: str, local: str,
+              progress: Optional[Callable[[int], None]], written: list,
+              fresh: bool = False) -> int:
+        try:
+            with self._sync(serial, fresh) as sock, open(local, "wb") as f:
+                self._sync_send(sock, b"RECV", remote.encode())
+                while True:
+                    kind, n = self._sync_reply(sock)
+                    if kind == b"DATA":
+                        f.write(_recv_exact(sock, n))
+                        written[0] += n
+                        if progress:
+                            progress(n)
+                    elif kind == b"DONE":
+                        break
+                    elif kind == b"FAIL":
+                        raise AdbError(_recv_exact(sock, n).decode("utf-8", "replace"))
+                    else:
+                        raise AdbError(f"Unexpected sync reply: {kind!r}")
+        except BaseException:
+            if os.path.exists(local):
+                os.remove(local)
+            raise
+        return written[0]
+
+    def push(self, serial: Optional[str], local: str, remote: str, mode: int = 0o644) -> int:
+        """Copy `local` to the device; returns bytes sent."""
+        try:
+            return self._push(serial, local, remote, mode)
+        except _StaleSync:
+            return self._push(serial, local, remote, mode, fresh=True)
+
+    def _push(self, serial: Optional[str], local: str, remote: str, mode: int,
+              fresh: bool = False) -> int:
+        sent = 0
+        with self._sync(serial, fresh) as sock, open(local, "rb") as f:
+            self._sync_send(sock, b"SEND", f"{remote},{mode | 0o100000}".encode())
+            while True:
+                chunk = f.read(self.SYNC_DATA_MAX)
+                if not chunk:
+                    break
+                self._sync_send(sock, b"DATA", chunk)
+                sent += len(chunk)
+            sock.sendall(b"DONE" + struct.pack("<I", int(os.path.getmtime(local))))
+            kind, n = self._sync_reply(sock)
+            if kind == b"FAIL":
+                raise AdbError(_recv_exact(sock, n).decode("utf-8", "replace"))
+            if kind != b"OKAY":
+                raise AdbError(f"Unexpected sync reply: {kind!r}")
+        return sent
+
+    def close(self):
+        """Close every pooled sync session."""
+        with self._lock:
+            for socks in self._pool.values():
+                for sock in socks:
+                    sock.close()
+            self._pool.clear()
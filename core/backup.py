@@ -4,12 +4,25 @@ Full and partial partition backup/restore via fastboot or ADB.
 """
 
 import os
+import re
+import queue
+import shlex
 import time
 import subprocess
 import tarfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
+from typing import Dict, Optional, Tuple
 
+from core.adb import AdbClient, AdbError
+from core.device import DeviceManager
+from core.logger import Progress
+
+
+# Partition names go into device shell commands and local file names
+PARTITION_NAME = re.compile(r"^[A-Za-z0-9_][A-Za-z0-9_.-]*$")
 
 COMMON_PARTITIONS = [
     "boot", "boot_a", "boot_b",
@@ -26,8 +39,13 @@ COMMON_PARTITIONS = [
 
 class BackupManager:
 
-    def __init__(self, log):
-        self.log = log
+    PULL_WORKERS = 3                       # concurrent adb sync pulls
+    BLOCK_DIR    = "/dev/block/by-name"
+
+    def __init__(self, log, serial: Optional[str] = None):
+        self.log    = log
+        self.serial = serial    # pin every adb/fastboot call to this device (-s)
+        self.dev    = DeviceManager(log, serial)
 
     def _run(self, cmd: list) -> tuple:
         try:
@@ -45,47 +63,44 @@ class BackupManager:
             size /= 1024
         return f"{size:.1f} TB"
 
-    def backup(self, partitions: list = None, out_dir: str = None, compress: bool = False):
+    def backup(self, partitions: list = None, out_dir: str = None, compress: bool = False,
+               workers: int = 0):
+        """
+        Back up partitions to <out_dir>/<name>.img. Over ADB, availability and
+        sizes come from one shell query and up to `workers` partitions are
+        pulled at once; in Fastboot they are fetched one by one.
+        """
         self.log.header("Partition Backup")
 
+        targets = partitions or COMMON_PARTITIONS
+        invalid = [p for p in targets if not PARTITION_NAME.match(p)]
+        if invalid:
+            self.log.error(f"Invalid partition name(s): {', '.join(map(repr, invalid))}")
+            return None
+
         ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-        out_dir = out_dir or os.path.expanduser(f"~/storage/downloads/MiFlasher/backups/backup_{ts}")
+        name    = f"backup_{self.serial.replace(':', '_')}_{ts}" if self.serial else f"backup_{ts}"
+        out_dir = out_dir or os.path.expanduser(f"~/storage/downloads/MiFlasher/backups/{name}")
         os.makedirs(out_dir, exist_ok=True)
 
-        targets = partitions or COMMON_PARTITIONS
+        # In fastboot, the getvar snapshot says which of the common partitions exist
+        info = self.dev.detect()
+        fb   = self.dev.fb_vars if info else None
+        if fb and fb.partition_sizes and not partitions:
+            missing = [p for p in targets if not fb.has_partition(p)]
+            targets = [p for p in targets if fb.has_partition(p)]
+            if missing:
+                self.log.info(f"Not on this device: {', '.join(missing)}")
         self.log.info(f"Partitions: {', '.join(targets)}")
         self.log.info(f"Output:     {out_dir}")
-        print()
-
-        backed_up = []
-        failed    = []
 
-        for i, part in enumerate(targets, 1):
-            out_img = os.path.join(out_dir, f"{part}.img")
-            self.log.step(i, len(targets), f"Backing up: {part}")
-
-            # Try fastboot first
-            rc, _, err = self._run(["fastboot", "fetch", part, out_img])
-            if rc == 0 and os.path.exists(out_img):
-                self.log.success(f"  ✓ {part}.img ({self._fmt_size(out_img)})")
-                backed_up.append(part)
-                continue
-
-            # Fallback: ADB pull (if partition visible in /dev/block/)
-            block = f"/dev/block/by-name/{part}"
-            rc, out, _ = self._run(["adb", "shell", "ls", block])
-            if rc == 0:
-                rc, _, err = self._run(["adb", "pull", block, out_img])
-                if rc == 0 and os.path.exists(out_img):
-                    self.log.success(f"  ✓ {part}.img ({self._fmt_size(out_img)}) [adb]")
-                    backed_up.append(part)
-                    continue
-
-            self.log.warning(f"  ✗ Could not backup: {part} ({err})")
-            failed.append(part)
+        if info and info.mode in ("adb", "recovery"):
+            backed_up, failed = self._backup_adb(targets, out_dir, workers or self.PULL_WORKERS,
+                                                 explicit=bool(partitions))
+        else:
+            backed_up, failed = self._backup_fastboot(targets, out_dir)
 
         # Summary
-        print()
         self.log.table(
             ["Result", "Count", "Partitions"],
             [
@@ -106,6 +121,111 @@ class BackupManager:
         self.log.success(f"Backup saved to: {out_dir}")
         return out_dir
 
+    # ── Backends ──────────────────────────────────────────────────────────────
+
+    def _backup_fastboot(self, targets: list, out_dir: str) -> Tuple[list, list]:
+        """`fastboot fetch` each partition in turn — one transfer at a time per device."""
+        backed_up, failed = [], []
+        for i, part in enumerate(targets, 1):
+            self.log.checkpoint()
+            out_img = os.path.join(out_dir, f"{part}.img")
+            self.log.step(i, len(targets), f"Backing up: {part}")
+            rc, _, err = self._run(self.dev._pinned(["fastboot", "fetch", part, out_img]))
+            if rc == 0 and os.path.exists(out_img):
+                self.log.success(f"  ✓ {part}.img ({self._fmt_size(out_img)})")
+                backed_up.append(part)
+            else:
+                self.log.warning(f"  ✗ Could not backup: {part} ({err})")
+                failed.append(part)
+        return backed_up, failed
+
+    def _partition_sizes(self, targets: list) -> Optional[Dict[str, int]]:
+        """{partition: bytes} for the targets present under BLOCK_DIR — one shell round-trip."""
+        names = " ".join(shlex.quote(p) for p in targets)
+        cmd = (f"for p in {names}; do b={self.BLOCK_DIR}/$p; "
+               f"[ -e \"$b\" ] && "
+               f"echo \"$p $(blockdev --getsize64 \"$b\" 2>/dev/null || echo 0)\"; done")
+        try:
+            _, out = AdbClient.shared().shell(self.serial, cmd)
+        except (AdbError, OSError) as e:
+            self.log.debug(f"partition query failed: {e}")
+            return None
+        sizes = {}
+        for line in out.splitlines():
+            name, _, size = line.strip().partition(" ")
+            if name in targets:
+                sizes[name] = int(size) if size.isdigit() else 0
+        return sizes
+
+    def _backup_adb(self, targets: list, out_dir: str, workers: int,
+                    explicit: bool = False) -> Tuple[list, list]:
+        """
+        Pull block devices over adb sync, `workers` at a time, with one progress
+        bar (and throughput figure) for all of them together. Absent partitions
+        count as failed only when they were asked for by name (`explicit`).
+        """
+        sizes = self._partition_sizes(targets)
+        if sizes is None:
+            sizes = {p: 0 for p in targets}          # unknown: try them all
+        missing = [p for p in targets if p not in sizes]
+        if missing:
+            self.log.info(f"Not on this device: {', '.join(missing)}")
+        parts = [p for p in targets if p in sizes]
+        if not parts:
+            return [], missing if explicit else []
+        total = sum(sizes.values()) if all(sizes[p] for p in parts) else None
+        self.log.info(f"Pulling {len(parts)} partition(s), {min(workers, len(parts))} at a time")
+
+        adb     = AdbClient.shared()
+        updates = queue.Queue()   # bytes pulled (int) or (partition, error) when one ends
+        stop    = threading.Event()
+
+        def progress(n):
+            if stop.is_set():
+                raise AdbError("cancelled")
+            updates.put(n)
+
+        def pull(part):
+            try:
+                adb.pull(self.serial, f"{self.BLOCK_DIR}/{part}",
+                         os.path.join(out_dir, f"{part}.img"), progress=progress)
+                updates.put((part, None))
+            except Exception as e:
+                updates.put((part, str(e)))
+
+        results = {}
+        bar     = Progress(self.log, "Backup", total)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pull") as pool:
+            for part in parts:
+                pool.submit(pull, part)
+            try:
+                # the bar and the cancel check run on this thread only
+                while len(results) < len(parts):
+                    item = updates.get()
+                    if isinstance(item, int):
+                        bar.update(item)
+                    else:
+                        results[item[0]] = item[1]
+                    self.log.checkpoint()
+            except BaseException:
+                stop.set()
+                raise
+        bar.finish()
+
+        elapsed = max(time.monotonic() - bar.start, 1e-3)
+        self.log.info(f"Pulled {bar.done / 1024 ** 2:.1f} MB in {elapsed:.1f}s "
+                      f"({bar.done / elapsed / 1024 ** 2:.1f} MB/s)")
+        backed_up, failed = [], missing if explicit else []
+        for part in parts:
+            out_img = os.path.join(out_dir, f"{part}.img")
+            if results[part] is None:
+                self.log.success(f"  ✓ {part}.img ({self._fmt_size(out_img)}) [adb]")
+                backed_up.append(part)
+            else:
+                self.log.warning(f"  ✗ Could not backup: {part} ({results[part]})")
+                failed.append(part)
+        return backed_up, failed
+
     def restore(self, path: str, partitions: list = None):
         self.log.header("Partition Restore")
 
@@ -137,9 +257,10 @@ class BackupManager:
 
         success = True
         for i, img in enumerate(imgs, 1):
+            self.log.checkpoint()
             partition = img.stem
             self.log.step(i, len(imgs), f"Restoring {partition}")
-            rc, _, err = self._run(["fastboot", "flash", partition, str(img)])
+            rc, _, err = self._run(self.dev._pinned(["fastboot", "flash", partition, str(img)]))
             if rc == 0:
                 self.log.success(f"  ✓ {partition}")
             else:
@@ -148,5 +269,5 @@ class BackupManager:
 
         if success:
             self.log.success("Restore complete! Rebooting...")
-            self._run(["fastboot", "reboot"])
+            self._run(self.dev._pinned(["fastboot", "reboot"]))
         return success
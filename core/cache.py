@@ -0,0 +1,342 @@
+"""
+MiFlasher ROM Cache
+Content-addressed store for downloaded ROMs: sha256 → file, plus a URL → digest
+index so repeat flashes of the same build never touch the network.
+Supports: LRU eviction bounded by `cache_max_gb`, hard-link / reflink materialisation,
+downloads on another filesystem indexed in place.
+Also keeps extracted ROM trees between flashes (ExtractCache).
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional
+
+from core.config import load_config
+
+
+FICLONE = 0x40049409   # Linux ioctl: reflink (btrfs, xfs, f2fs with reflink)
+
+
+def _reflink(src: str, dst: str) -> bool:
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    try:
+        with open(src, "rb") as s, open(dst, "wb") as d:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+        return True
+    except OSError:
+        if os.path.exists(dst):
+            os.remove(dst)
+        return False
+
+
+def link_or_clone(src: str, dst: str) -> bool:
+    """Create dst sharing src's data: hard link first, then reflink. No copying."""
+    if os.path.exists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+        return True
+    except OSError:
+        return _reflink(src, dst)
+
+
+class RomCache:
+
+    INDEX = "index.json"
+
+    _lock = threading.Lock()   # one index writer per process
+
+    def __init__(self, log, root: Optional[str] = None, max_bytes: Optional[int] = None):
+        cfg = load_config()
+        self.log       = log
+        self.root      = os.path.expanduser(root or os.path.join(cfg["cache_dir"], "roms"))
+        self.max_bytes = max_bytes if max_bytes is not None else \
+            int(float(cfg["cache_max_gb"]) * 1024 ** 3)
+        self._index_path = os.path.join(self.root, self.INDEX)
+
+    # ── Index ─────────────────────────────────────────────────────────────────
+
+    def _load_index(self) -> dict:
+        try:
+            with open(self._index_path) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = {}
+        index.setdefault("urls", {})
+        index.setdefault("objects", {})
+        return index
+
+    def _save_index(self, index: dict):
+        os.makedirs(self.root, exist_ok=True)
+        with open(self._index_path + ".new", "w") as f:
+            json.dump(index, f, indent=1)
+        os.replace(self._index_path + ".new", self._index_path)
+
+    def _object_path(self, digest: str) -> str:
+        return os.path.join(self.root, "objects", digest[:2], digest)
+
+    def _file(self, meta: dict, digest: str) -> str:
+        """Where an object's data lives: in the store, or where it was downloaded."""
+        return meta.get("path") or self._object_path(digest)
+
+    def _intact(self, index: dict, digest: str) -> bool:
+        meta = index["objects"].get(digest)
+        if not meta:
+            return False
+        path = self._file(meta, digest)
+        return os.path.isfile(path) and os.path.getsize(path) == meta["size"]
+
+    # ── Public API ────────────────────────────────────────────────────────────
+
+    def lookup(self, urls: Optional[List[str]] = None,
+               digest: Optional[str] = None) -> Optional[str]:
+        """Digest of a cached ROM matching `digest`, or any of `urls`; None on miss."""
+        with self._lock:
+            index = self._load_index()
+            if digest:
+                candidates = [digest.lower()]
+            else:
+                candidates = [index["urls"][u] for u in urls or [] if u in index["urls"]]
+            for d in candidates:
+                if self._intact(index, d):
+                    index["objects"][d]["used"] = time.time()
+                    self._save_index(index)
+                    return d
+        return None
+
+    def materialize(self, digest: str, dest: str) -> str:
+        """
+        Make the cached ROM available at `dest` without copying. Falls back to
+        the cache object itself when links/reflinks aren't supported (e.g. /sdcard).
+        """
+        with self._lock:
+            meta = self._load_index()["objects"].get(digest, {})
+        src = self._file(meta, digest)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        if os.path.exists(dest) and os.path.samefile(src, dest):
+            return dest
+        if link_or_clone(src, dest):
+            return dest
+        self.log.debug("Hard link / reflink unsupported here — using cached file in place")
+        return src
+
+    def add(self, path: str, digest: str, urls: Optional[List[str]] = None) -> str:
+        """
+        Store a freshly downloaded file under its digest and index its URLs.
+        A file on another filesystem than the cache (Termux /sdcard vs app
+        storage) is indexed where it is rather than copied in.
+        Returns the path the caller should use from now on.
+        """
+        digest = digest.lower()
+        obj    = self._object_path(digest)
+        os.makedirs(os.path.dirname(obj), exist_ok=True)
+        with self._lock:
+            index = self._load_index()
+            if not self._intact(index, digest):
+                meta = {
+                    "size": os.path.getsize(path),
+                    "name": os.path.basename(path),
+                    "used": time.time(),
+                }
+                if not link_or_clone(path, obj):
+                    meta["path"] = os.path.abspath(path)
+                    self.log.debug("Cache is on another filesystem — "
+                                   "indexing the download in place")
+                index["objects"][digest] = meta
+            for url in urls or []:
+                index["urls"][url] = digest
+            self._evict(index, keep=digest)
+            self._save_index(index)
+        self.log.debug(f"Cached {os.path.basename(path)} as {digest[:16]}...")
+        return path if os.path.exists(path) else self.materialize(digest, path)
+
+    def _evict(self, index: dict, keep: Optional[str] = None):
+        """
+        Drop least-recently-used objects until the cache fits in max_bytes.
+        Downloads indexed in place take no cache space; they are only forgotten
+        once they have been moved or deleted.
+        """
+        objects = index["objects"]
+        for digest in [d for d, m in objects.items() if "path" in m]:
+            if digest != keep and not self._intact(index, digest):
+                del objects[digest]
+        total = sum(m["size"] for m in objects.values() if "path" not in m)
+        for digest, meta in sorted(objects.items(), key=lambda kv: kv[1]["used"]):
+            if total <= self.max_bytes:
+                break
+            if digest == keep or "path" in meta:
+                continue
+            try:
+                os.remove(self._object_path(digest))
+            except OSError:
+                pass
+            total -= meta["size"]
+            del objects[digest]
+            self.log.info(f"Cache: evicted {meta.get('name', digest[:16])}")
+        index["urls"] = {u: d for u, d in index["urls"].items() if d in objects}
+
+
+class ExtractCache:
+    """
+    Extracted ROM trees kept between flashes, keyed by archive name + size + mtime.
+    Each tree carries a manifest of its files (size + sha256); sizes are checked
+    on every reuse and hashes on the first. Bounded by `extract_cache_max_gb`, LRU.
+
+    Trees handed out by lookup() / begin() are in use until release(): they are
+    never evicted or re-extracted meanwhile, and a lookup waits for an
+    extraction of the same archive that is still running.
+    """
+
+    MANIFEST = ".miflasher_manifest.json"
+    HASH_BUFSIZE = 1024 * 1024
+
+    _cond       = threading.Condition()   # several flash jobs may share one tree
+    _users      = {}                      # tree → jobs using it
+    _extracting = set()                   # trees between begin() and commit()
+
+    def __init__(self, log, root: str, max_bytes: Optional[int] = None):
+        self.log       = log
+        self.root      = root
+        self.max_bytes = max_bytes if max_bytes is not None else \
+            int(float(load_config()["extract_cache_max_gb"]) * 1024 ** 3)
+
+    def path_for(self, archive: str) -> str:
+        st   = os.stat(archive)
+        stem = Path(archive).stem.replace(".tar", "")
+        return os.path.join(self.root, f"{stem}-{st.st_size:x}-{st.st_mtime_ns:x}")
+
+    def _manifest(self, tree: str) -> Optional[dict]:
+        try:
+            with open(os.path.join(tree, self.MANIFEST)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_manifest(self, tree: str, manifest: dict):
+        path = os.path.join(tree, self.MANIFEST)
+        with open(path + ".new", "w") as f:
+            json.dump(manifest, f, indent=1)
+        os.replace(path + ".new", path)
+
+    def _sha256(self, path: str) -> str:
+        with open(path, "rb") as f:
+            if hasattr(hashlib, "file_digest"):   # Python 3.11+
+                return hashlib.file_digest(f, "sha256").hexdigest()
+            h = hashlib.sha256()
+            for chunk in iter(lambda: f.read(self.HASH_BUFSIZE), b""):
+                h.update(chunk)
+        return h.hexdigest()
+
+    def _damaged(self, tree: str, manifest: dict, hashes: bool) -> Optional[str]:
+        """Relpath of the first missing, resized or (with `hashes`) altered file."""
+        for rel, meta in manifest["files"].items():
+            p = os.path.join(tree, rel)
+            if not os.path.isfile(p) or os.path.getsize(p) != meta["size"]:
+                return rel
+            if hashes and meta.get("sha256") and self._sha256(p) != meta["sha256"]:
+                return rel
+        return None
+
+    def _discard(self, tree: str):
+        """Delete a tree nobody is using any more (called with _cond held)."""
+        if not self._users.get(tree) and tree not in self._extracting:
+            shutil.rmtree(tree, ignore_errors=True)
+
+    def lookup(self, archive: str) -> Optional[str]:
+        """
+        Cached tree for `archive` if every recorded file is still intact, else
+        None. A hit is in use until release().
+        """
+        tree = self.path_for(archive)
+        with self._cond:
+            self._cond.wait_for(lambda: tree not in self._extracting)
+            manifest = self._manifest(tree)
+            if not manifest:
+                return None
+            self._users[tree] = self._users.get(tree, 0) + 1
+        # hashing a multi-GB tree must not hold up other jobs' lookups
+        verify  = not manifest.get("verified")
+        damaged = self._damaged(tree, manifest, hashes=verify)
+        with self._cond:
+            if damaged:
+                self.log.warning(f"Cached extraction damaged ({damaged}) — extracting again")
+                try:
+                    os.remove(os.path.join(tree, self.MANIFEST))   # deleted once unused
+                except OSError:
+                    pass
+            manifest = self._manifest(tree)
+            if not manifest:
+                self._release(tree)
+                return None
+            manifest["used"] = time.time()
+            if verify:
+                manifest["verified"] = True
+            self._write_manifest(tree, manifest)
+        return tree
+
+    def begin(self, archive: str) -> str:
+        """
+        Fresh (empty) directory to extract `archive` into, in use until
+        release(). Waits for other jobs to finish with an old tree first.
+        """
+        tree = self.path_for(archive)
+        with self._cond:
+            self._cond.wait_for(lambda: not self._users.get(tree) and tree not in self._extracting)
+            shutil.rmtree(tree, ignore_errors=True)
+            os.makedirs(tree, exist_ok=True)
+            self._extracting.add(tree)
+            self._users[tree] = 1
+        return tree
+
+    def commit(self, archive: str, tree: str, files: dict):
+        """Record a completed extraction. `files` maps relpath → {"size", "sha256"}."""
+        with self._cond:
+            self._write_manifest(tree, {
+                "archive": os.path.basename(archive),
+                "files":   files,
+                "size":    sum(m["size"] for m in files.values()),
+                "used":    time.time(),
+            })
+            self._extracting.discard(tree)
+            self._evict(keep=tree)
+            self._cond.notify_all()
+
+    def release(self, tree: str):
+        """Done with a tree from lookup() / begin(); an uncommitted one is deleted."""
+        with self._cond:
+            self._release(tree)
+
+    def _release(self, tree: str):
+        self._users[tree] = self._users.get(tree, 1) - 1
+        if self._users[tree] <= 0:
+            del self._users[tree]
+        self._extracting.discard(tree)
+        if not self._manifest(tree):
+            self._discard(tree)
+        self._cond.notify_all()
+
+    def _evict(self, keep: Optional[str] = None):
+        """Drop least-recently-used trees until the cache fits in max_bytes (skips trees in use)."""
+        trees = []
+        for name in os.listdir(self.root):
+            tree = os.path.join(self.root, name)
+            manifest = self._manifest(tree) if os.path.isdir(tree) else None
+            if manifest:
+                trees.append((manifest["used"], manifest["size"], tree))
+        total = sum(size for _, size, _ in trees)
+        for _, size, tree in sorted(trees):
+            if total <= self.max_bytes:
+                break
+            if tree == keep or self._users.get(tree):
+                continue
+            self.log.info(f"Extract cache: evicted {os.path.basename(tree)}")
+            shutil.rmtree(tree, ignore_errors=True)
+            total -= size
@@ -16,22 +16,31 @@ DEFAULTS = {
     "gui_port":      8080,
     "gui_host":      "localhost",
     "verbose":       False,
+    "cache_dir":     "~/.cache/miflasher",
+    "cache_max_gb":  20,
+    "extract_cache_max_gb": 25,
+    "xiaomi_mirrors": False,
 }
 
 
+def load_config() -> dict:
+    """Current config merged over DEFAULTS (read-only helper for core modules)."""
+    if os.path.exists(CONFIG_FILE):
+        try:
+            with open(CONFIG_FILE) as f:
+                return {**DEFAULTS, **json.load(f)}
+        except Exception:
+            pass
+    return dict(DEFAULTS)
+
+
 class ConfigManager:
     def __init__(self, log):
         self.log  = log
         self._cfg = self._load()
 
     def _load(self):
-        if os.path.exists(CONFIG_FILE):
-            try:
-                with open(CONFIG_FILE) as f:
-                    return {**DEFAULTS, **json.load(f)}
-            except Exception:
-                pass
-        return dict(DEFAULTS)
+        return load_config()
 
     def _save(self):
         os.makedirs(os.path.dirname(CONFIG_FILE), exist_ok=True)
@@ -8,8 +8,13 @@ import json
 import time
 import re
 import os
-from dataclasses import dataclass, field, asdict
-from typing import Optional
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, asdict, replace
+from typing import Dict, List, Optional, Tuple
+
+from core.adb import AdbClient, AdbError, adb_mode
+from core.watch import DeviceEvent, DeviceWatcher, fastboot_serials
 
 
 @dataclass
@@ -33,6 +38,132 @@ class DeviceInfo:
     security:    str = "unknown"     # Android security patch
 
 
+def _int(val: str) -> int:
+    try:
+        return int(val, 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+@dataclass
+class FastbootVars:
+    """Typed snapshot of one `fastboot getvar all`."""
+    vars:              Dict[str, str]  = field(default_factory=dict)
+    partition_sizes:   Dict[str, int]  = field(default_factory=dict)   # bytes, with slot suffix
+    partition_types:   Dict[str, str]  = field(default_factory=dict)   # raw | ext4 | f2fs ...
+    logical:           Dict[str, bool] = field(default_factory=dict)   # lives inside super
+    slot_count:        int  = 0
+    current_slot:      str  = ""
+    is_userspace:      bool = False     # fastbootd
+    max_download_size: int  = 0
+    unlocked:          str  = ""        # yes | no
+
+    @classmethod
+    def parse(cls, out: str) -> "FastbootVars":
+        snap = cls()
+        for line in out.splitlines():
+            line = line.strip()
+            if line.startswith("(bootloader)"):
+                line = line[len("(bootloader)"):].strip()
+            # per-partition vars: "partition-size:boot_a: 0x6000000"
+            m = re.match(r"(partition-size|partition-type|is-logical):([^:\s]+):\s*(.*)$", line)
+            if m:
+                kind, part, val = m.groups()
+                if kind == "partition-size":
+                    snap.partition_sizes[part] = _int(val)
+                elif kind == "partition-type":
+                    snap.partition_types[part] = val
+                else:
+                    snap.logical[part] = val == "yes"
+                continue
+            key, sep, val = line.partition(":")
+            if sep and key and " " not in key and val.strip():
+                snap.vars[key] = val.strip()
+
+        snap.slot_count        = _int(snap.vars.get("slot-count", "0"))
+        snap.current_slot      = snap.vars.get("current-slot", "").lstrip("_")
+        snap.is_userspace      = snap.vars.get("is-userspace") == "yes"
+        snap.max_download_size = _int(snap.vars.get("max-download-size", "0"))
+        snap.unlocked          = snap.vars.get("unlocked", "")
+        return snap
+
+    def has_partition(self, name: str) -> bool:
+        return any(p in self.partition_sizes for p in (name, f"{name}_a", f"{name}_b"))
+
+    def partition_size(self, name: str) -> int:
+        """Size in bytes of `name` (or its _a slot); 0 when unknown."""
+        return self.partition_sizes.get(name) or self.partition_sizes.get(f"{name}_a", 0)
+
+    def is_logical(self, name: str) -> bool:
+        return self.logical.get(name) or self.logical.get(f"{name}_a", False)
+
+
+@dataclass
+class _CacheEntry:
+    mode:    str                                             # as listed: adb | recovery | fastboot
+    info:    DeviceInfo
+    fetched: Dict[str, float] = field(default_factory=dict)   # DeviceInfo field → time gathered
+    fb_vars: Optional[FastbootVars] = None
+
+
+class DeviceCache:
+    """
+    Process-wide DeviceInfo per serial. Static fields (model, codename, build...)
+    are kept for the session; dynamic ones expire after their TTL and are
+    re-read on the next detect(). Reboots, flashes and watcher events drop a
+    device's entry, as does seeing it in a different mode.
+    """
+
+    TTL = {"battery": 30.0, "storage": 60.0, "ram": 10.0}   # seconds; other fields: session
+
+    _entries: Dict[str, _CacheEntry] = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def entry(cls, serial: str, mode: str) -> _CacheEntry:
+        """The entry for `serial`, started afresh when missing or the mode changed."""
+        with cls._lock:
+            e = cls._entries.get(serial)
+            if e is None or e.mode != mode:
+                e = cls._entries[serial] = _CacheEntry(mode, DeviceInfo(serial=serial, mode=mode))
+            return e
+
+    @classmethod
+    def stale(cls, e: _CacheEntry, names) -> bool:
+        now = time.time()
+        for name in names:
+            t, ttl = e.fetched.get(name), cls.TTL.get(name)
+            if t is None or (ttl is not None and now - t > ttl):
+                return True
+        return False
+
+    @classmethod
+    def update(cls, e: _CacheEntry, info: DeviceInfo, names,
+               fb_vars: Optional[FastbootVars] = None):
+        """Copy the freshly gathered `names` from info into the entry."""
+        now = time.time()
+        with cls._lock:
+            for name in names:
+                setattr(e.info, name, getattr(info, name))
+                e.fetched[name] = now
+            if fb_vars is not None:
+                e.fb_vars = fb_vars
+
+    @classmethod
+    def invalidate(cls, serial: Optional[str] = None):
+        """Forget one device (every device when serial is None)."""
+        with cls._lock:
+            if serial:
+                cls._entries.pop(serial, None)
+            else:
+                cls._entries.clear()
+
+    @classmethod
+    def follow(cls, watcher: DeviceWatcher):
+        """Drop a device's entry on every watcher event (reconnect, mode change...)."""
+        return watcher.subscribe(lambda ev: cls.invalidate(ev.serial))
+
+
 class DeviceManager:
 
     REBOOT_CMDS = {
@@ -50,9 +181,32 @@ class DeviceManager:
         "edl":        ["fastboot", "oem", "edl"],
     }
 
-    def __init__(self, log):
-        self.log  = log
+    # Everything _gather_adb needs, fetched in one `adb shell` round-trip
+    ADB_PROBE = [
+        ("props",   "getprop"),
+        ("battery", "dumpsys battery"),
+        ("df",      "df /data"),
+        ("meminfo", "cat /proc/meminfo"),
+        ("wm_size", "wm size"),
+        ("density", "wm density"),
+    ]
+    PROBE_MARK = "@@miflasher:"
+    # DeviceInfo fields each probe section fills (what to re-run when a field expires)
+    PROBE_FIELDS = {
+        "props":   ("brand", "model", "codename", "android", "miui", "build", "cpu_abi",
+                    "kernel", "security", "slot", "unlocked"),
+        "battery": ("battery",),
+        "df":      ("storage",),
+        "meminfo": ("ram",),
+        "wm_size": ("display",),
+        "density": ("display",),
+    }
+
+    def __init__(self, log, serial: Optional[str] = None):
+        self.log    = log
+        self.serial = serial    # pin every adb/fastboot call to this device (-s)
         self._info: Optional[DeviceInfo] = None
+        self.fb_vars: Optional[FastbootVars] = None   # set when detected in fastboot
 
     # ── Internal helpers ──────────────────────────────────────────────────────
 
@@ -63,14 +217,58 @@ class DeviceManager:
         except (subprocess.TimeoutExpired, FileNotFoundError, Exception):
             return ""
 
+    def _pinned(self, cmd: list) -> list:
+        """Insert `-s <serial>` after the tool name when pinned to a device."""
+        if not self.serial:
+            return list(cmd)
+        return [cmd[0], "-s", self.serial, *cmd[1:]]
+
     def _adb(self, *args) -> str:
-        return self._run(["adb", *args])
+        """`adb shell ...` through the adb server connection — no adb process per call."""
+        if args and args[0] == "shell":
+            return self._adb_shell(" ".join(args[1:]))
+        return self._run(self._pinned(["adb", *args]))
+
+    def _adb_shell(self, cmd: str, serial: Optional[str] = None) -> str:
+        try:
+            _, out = AdbClient.shared().shell(serial or self.serial, cmd)
+            return out.strip()
+        except (AdbError, OSError) as e:
+            self.log.debug(f"adb shell failed: {e}")
+            return ""
 
     def _adb_prop(self, prop: str) -> str:
         return self._adb("shell", "getprop", prop)
 
+    def _adb_probe(self, serial: Optional[str] = None, sections=None) -> dict:
+        """
+        Run ADB_PROBE commands (all, or just `sections`) in a single `adb shell`;
+        returns {section: output}.
+        """
+        # leading bare `echo` keeps a marker off the previous line when output lacks "\n"
+        script = "; ".join(f"echo; echo {self.PROBE_MARK}{name}; {cmd} 2>&1"
+                           for name, cmd in self.ADB_PROBE
+                           if sections is None or name in sections)
+        out = self._adb_shell(script, serial)
+        sections, current = {}, None
+        for line in out.splitlines():
+            if line.startswith(self.PROBE_MARK):
+                current = line[len(self.PROBE_MARK):].strip()
+                sections[current] = []
+            elif current:
+                sections[current].append(line)
+        return {name: "\n".join(lines) for name, lines in sections.items()}
+
     def _fastboot(self, *args) -> str:
-        return self._run(["fastboot", *args])
+        return self._run(self._pinned(["fastboot", *args]))
+
+    def fastboot_vars(self, refresh: bool = False) -> Optional[FastbootVars]:
+        """`getvar all` snapshot — one round-trip, cached until refresh. None outside fastboot."""
+        if self.fb_vars is None or refresh:
+            snap = FastbootVars.parse(self._run(self._pinned(["fastboot", "getvar", "all"]),
+                                                timeout=15))
+            self.fb_vars = snap if snap.vars else None
+        return self.fb_vars
 
     def _fastboot_var(self, var: str) -> str:
         out = self._fastboot("getvar", var)
@@ -82,32 +280,48 @@ class DeviceManager:
 
     # ── Detection ─────────────────────────────────────────────────────────────
 
-    def detect(self) -> Optional[DeviceInfo]:
+    def list_devices(self) -> List[Tuple[str, str]]:
+        """(serial, mode) for every attached device — ADB devices first, then Fastboot."""
+        found = []
+        try:
+            adb_devices = AdbClient.shared().devices()
+        except (AdbError, OSError) as e:
+            self.log.debug(f"adb server unavailable: {e}")
+            adb_devices = []
+        for serial, state in adb_devices:
+            mode = adb_mode(state)
+            if mode:
+                found.append((serial, mode))
+        for serial in fastboot_serials():
+            found.append((serial, "fastboot"))
+        return found
+
+    def detect(self, refresh: bool = False) -> Optional[DeviceInfo]:
+        """
+        The attached device (or the pinned one). Details come from DeviceCache:
+        only missing or expired fields are gathered; refresh=True re-reads everything.
+        """
         info = DeviceInfo()
 
-        # 1. Try ADB
-        adb_out = self._run(["adb", "devices"])
-        adb_lines = [l for l in adb_out.splitlines()[1:] if l.strip() and "offline" not in l]
-        if adb_lines:
-            info.serial = adb_lines[0].split()[0]
-            state       = adb_lines[0].split()[-1]  # device | recovery | sideload
-            if state == "recovery":
-                info.mode = "recovery"
-            else:
-                info.mode = "adb"
-            self._gather_adb(info)
+        # 1. ADB, then 2. Fastboot (restricted to self.serial when pinned)
+        devices = self.list_devices()
+        self.fb_vars = None
+        if self.serial:
+            devices = [d for d in devices if d[0] == self.serial]
+            # network fastboot devices (tcp:HOST) never show up in `fastboot devices`
+            if not devices and self.serial.startswith("tcp:") and self.fastboot_vars():
+                devices = [(self.serial, "fastboot")]
+        if devices:
+            serial, mode = devices[0]
+            if refresh:
+                DeviceCache.invalidate(serial)
+            info = self._cached_info(serial, mode)
             self._info = info
             return info
 
-        # 2. Try Fastboot
-        fb_out = self._run(["fastboot", "devices"])
-        fb_lines = [l for l in fb_out.splitlines() if l.strip()]
-        if fb_lines:
-            info.serial = fb_lines[0].split()[0]
-            info.mode   = "fastboot"
-            self._gather_fastboot(info)
-            self._info = info
-            return info
+        if self.serial:
+            self._info = None
+            return None
 
         # 3. Termux USB
         usb_out = self._run(["termux-usb", "-l"])
@@ -120,9 +334,50 @@ class DeviceManager:
         self._info = None
         return None
 
-    def _gather_adb(self, info: DeviceInfo):
-        """Populate DeviceInfo via ADB shell getprop."""
-        props = {
+    def inventory(self, devices: Optional[List[Tuple[str, str]]] = None) -> List[DeviceInfo]:
+        """
+        DeviceInfo for every attached device (or the given (serial, mode) pairs),
+        from DeviceCache; devices that need probing are probed concurrently.
+        """
+        devices = self.list_devices() if devices is None else devices
+        if not devices:
+            return []
+
+        def one(device):
+            serial, mode = device
+            return DeviceManager(self.log, serial)._cached_info(serial, mode)
+
+        with ThreadPoolExecutor(max_workers=min(len(devices), 8)) as pool:
+            return list(pool.map(one, devices))
+
+    def _cached_info(self, serial: str, mode: str) -> DeviceInfo:
+        """DeviceInfo for a listed device, gathering only what the cache lacks."""
+        e = DeviceCache.entry(serial, mode)
+        if mode == "fastboot":
+            if e.fb_vars is None:
+                info = DeviceInfo(serial=serial, mode=mode)
+                self._gather_fastboot(info)
+                if self.fb_vars:
+                    DeviceCache.update(e, info, asdict(info).keys(), fb_vars=self.fb_vars)
+                else:
+                    return info
+            self.fb_vars = e.fb_vars
+            return replace(e.info)
+
+        stale = [name for name, _ in self.ADB_PROBE
+                 if DeviceCache.stale(e, self.PROBE_FIELDS[name])]
+        if stale:
+            info = replace(e.info)
+            self._gather_adb(info, stale)
+            names = {f for name in stale for f in self.PROBE_FIELDS[name]}
+            DeviceCache.update(e, info, names)
+        return replace(e.info)
+
+    def _gather_adb(self, info: DeviceInfo, sections=None):
+        """Populate DeviceInfo from one batched ADB shell probe (all sections, or `sections`)."""
+        out   = self._adb_probe(info.serial, sections)
+        props = dict(re.findall(r"^\[([^\]]+)\]: \[(.*)\]\s*$", out.get("props", ""), re.M))
+        propmap = {
             "brand":    "ro.product.brand",
             "model":    "ro.product.model",
             "codename": "ro.product.device",
@@ -133,13 +388,13 @@ class DeviceManager:
             "kernel":   "ro.kernel.version",
             "security": "ro.build.version.security_patch",
         }
-        for attr, prop in props.items():
-            val = self._adb_prop(prop)
+        for attr, prop in propmap.items():
+            val = props.get(prop)
             if val:
                 setattr(info, attr, val)
 
         # Battery
-        bat = self._adb("shell", "dumpsys", "battery")
+        bat = out.get("battery", "")
         level_m = re.search(r"level:\s*(\d+)", bat)
         status_m = re.search(r"status:\s*(\d+)", bat)
         stat_map = {"1":"Unknown","2":"Charging","3":"Discharging","4":"Not charging","5":"Full"}
@@ -149,19 +404,20 @@ class DeviceManager:
             info.battery = f"{level}% ({status})"
 
         # Slot (A/B)
-        slot = self._adb_prop("ro.boot.slot_suffix")
-        info.slot = slot if slot else "N/A (A-only)"
+        if "props" in out:
+            slot = props.get("ro.boot.slot_suffix")
+            info.slot = slot if slot else "N/A (A-only)"
 
         # Bootloader lock state
-        verif = self._adb_prop("ro.boot.verifiedbootstate")
-        lock  = self._adb_prop("ro.boot.flash.locked")
+        verif = props.get("ro.boot.verifiedbootstate", "")
+        lock  = props.get("ro.boot.flash.locked", "")
         if verif == "green" or lock == "1":
             info.unlocked = "no (locked)"
         elif verif in ("orange", "yellow") or lock == "0":
             info.unlocked = "yes (unlocked)"
 
         # Storage
-        df = self._adb("shell", "df", "/data")
+        df = out.get("df", "")
         for line in df.splitlines():
             parts = line.split()
             if len(parts) >= 4 and "/data" in line:
@@ -174,7 +430,7 @@ class DeviceManager:
                 break
 
         # RAM
-        mem = self._adb("shell", "cat", "/proc/meminfo")
+        mem = out.get("meminfo", "")
         total_m = re.search(r"MemTotal:\s*(\d+)", mem)
         avail_m = re.search(r"MemAvailable:\s*(\d+)", mem)
         if total_m and avail_m:
@@ -183,8 +439,8 @@ class DeviceManager:
             info.ram = f"{avail_mb} MB free / {total_mb} MB total"
 
         # Display
-        wm = self._adb("shell", "wm", "size")
-        den = self._adb("shell", "wm", "density")
+        wm  = out.get("wm_size", "")
+        den = out.get("density", "")
         if wm:
             size_m = re.search(r"(\d+x\d+)", wm)
             den_m  = re.search(r"(\d+)", den)
@@ -194,24 +450,25 @@ class DeviceManager:
                     info.display += f" @ {den_m.group(1)} DPI"
 
     def _gather_fastboot(self, info: DeviceInfo):
-        """Populate DeviceInfo via fastboot getvar."""
+        """Populate DeviceInfo from a single `fastboot getvar all`."""
+        fb = self.fastboot_vars()
+        if not fb:
+            return
+        if fb.is_userspace:
+            info.mode = "fastbootd"
         varmap = {
             "product":           "codename",
             "version-baseband":  "build",
             "slot-count":        "slot",
-            "current-slot":      None,
-            "unlocked":          "unlocked",
         }
-        current_slot = self._fastboot_var("current-slot")
         for var, attr in varmap.items():
-            val = self._fastboot_var(var)
-            if val and attr:
-                setattr(info, attr, val)
-        if current_slot:
-            info.slot = f"_{current_slot}"
+            if fb.vars.get(var):
+                setattr(info, attr, fb.vars[var])
+        if fb.current_slot:
+            info.slot = f"_{fb.current_slot}"
 
         # unlocked comes as "yes" / "no" from fastboot
-        ul = self._fastboot_var("unlocked")
+        ul = fb.unlocked
         info.unlocked = "yes (unlocked)" if ul == "yes" else "no (locked)" if ul == "no" else "unknown"
 
     # ── Public API ────────────────────────────────────────────────────────────
@@ -252,22 +509,31 @@ class DeviceManager:
         ]
         self.log.table(["Property", "Value"], rows, title="Device Information")
 
-    def watch(self, interval: float = 2.0):
-        """Watch for device connect/disconnect in real-time."""
+    def watch(self):
+        """Watch for device connect / disconnect / mode changes in real-time."""
         self.log.header("Device Watch Mode")
         self.log.info("Watching for device changes... (Ctrl+C to stop)")
-        last_serial = None
+
+        def show(ev: DeviceEvent):
+            if ev.kind == "disconnected":
+                self.log.warning(f"Device disconnected: {ev.serial} [{ev.previous.upper()}]")
+                return
+            # full details once per event, never per tick
+            info = DeviceManager(self.log, ev.serial).detect()
+            name = f"{info.brand} {info.model} " if info and info.model != "unknown" else ""
+            if ev.kind == "mode_changed":
+                self.log.success(f"Mode changed: {name}({ev.serial}) "
+                                 f"{ev.previous.upper()} → {ev.mode.upper()}")
+            else:
+                self.log.success(f"Device connected: {name}({ev.serial}) [{ev.mode.upper()}]")
+
+        watcher = DeviceWatcher(self.log)
+        DeviceCache.follow(watcher)
+        watcher.subscribe(show)
         try:
-            while True:
-                info = self.detect()
-                serial = info.serial if info else None
-                if serial != last_serial:
-                    if info:
-                        self.log.success(f"Device connected: {info.brand} {info.model} ({info.serial}) [{info.mode.upper()}]")
-                    else:
-                        self.log.warning("Device disconnected.")
-                    last_serial = serial
-                time.sleep(interval)
+            with watcher:
+                while True:
+                    time.sleep(3600)
         except KeyboardInterrupt:
             self.log.info("Watch stopped.")
 
@@ -289,8 +555,16 @@ class DeviceManager:
             return False
 
         self.log.step(1, 1, f"Rebooting to {mode}...")
-        out = self._run(cmd)
-        if out:
-            self.log.debug(out)
+        if cmd[0] == "adb":
+            try:
+                AdbClient.shared().reboot(info.serial, cmd[2] if len(cmd) > 2 else "")
+            except (AdbError, OSError) as e:
+                self.log.error(f"Reboot failed: {e}")
+                return False
+        else:
+            out = self._run(self._pinned(cmd))
+            if out:
+                self.log.debug(out)
+        DeviceCache.invalidate(info.serial)
         self.log.success(f"Reboot command sent → {mode}")
         return True
@@ -1,17 +1,136 @@
 """
 MiFlasher Downloader
-Supports: resumable downloads, MD5/SHA256 verification, progress bar, mirrors.
+Supports: resumable downloads, segmented parallel downloads, MD5/SHA256 verification,
+progress bar, mirrors.
 """
 
 import os
+import json
+import queue
+import bisect
 import hashlib
+import threading
 import time
 import requests
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional, Union
+from urllib.parse import urlparse
+
+from core.config import load_config
 
 
 DEFAULT_DEST = os.path.expanduser("~/storage/downloads/MiFlasher")
+DEFAULT_CONNECTIONS = 4
+
+# Xiaomi CDN hosts that serve the same ROM paths — with the `xiaomi_mirrors`
+# config key on, a URL on any of them is raced against the others.
+XIAOMI_MIRRORS = [
+    "bigota.d.miui.com",
+    "hugeota.d.miui.com",
+    "cdnorg.d.miui.com",
+    "bn.d.miui.com",
+    "ultimateota.d.miui.com",
+    "bkt-sgp-miui-ota-update-alisgp.oss-ap-southeast-1.aliyuncs.com",
+]
+
+
+def expand_mirrors(urls: List[str]) -> List[str]:
+    """Add known Xiaomi CDN equivalents of any Xiaomi CDN URL (order kept, no dupes)."""
+    out = list(urls)
+    for url in urls:
+        parsed = urlparse(url)
+        if parsed.hostname in XIAOMI_MIRRORS:
+            out += [parsed._replace(netloc=host).geturl() for host in XIAOMI_MIRRORS]
+    return list(dict.fromkeys(out))
+
+
+def filename_for(url: str) -> str:
+    """Local file name used for a download URL."""
+    return url.split("?")[0].split("/")[-1] or "rom_download"
+
+
+class _StreamHasher:
+    """
+    Running digests of a file written front to back, so verification needs no
+    extra pass. hashlib state cannot be serialised, so after a restart the
+    already-downloaded prefix is re-read once (see sync()).
+    """
+
+    BUFSIZE = 1024 * 1024
+
+    def __init__(self, algos):
+        self.algos = tuple(dict.fromkeys(algos))
+        self.reset()
+
+    def reset(self):
+        self._h     = {a: hashlib.new(a) for a in self.algos}
+        self.offset = 0
+
+    def update(self, data):
+        for h in self._h.values():
+            h.update(data)
+        self.offset += len(data)
+
+    def feed_file(self, fd: int, end: int):
+        """Hash bytes [offset, end) that are already on disk."""
+        while self.offset < end:
+            data = os.pread(fd, min(self.BUFSIZE, end - self.offset), self.offset)
+            if not data:
+                break
+            self.update(data)
+
+    def sync(self, path: str, size: int):
+        """Bring the digests in line with the first `size` bytes of `path`."""
+        if self.offset > size:
+            self.reset()
+        if self.offset < size:
+            fd = os.open(path, os.O_RDONLY)
+            try:
+                self.feed_file(fd, size)
+            finally:
+                os.close(fd)
+
+    def hexdigests(self) -> dict:
+        return {a: h.hexdigest() for a, h in self._h.items()}
+
+
+class _MirrorPool:
+    """
+    Ranked mirrors shared by segment workers. A mirror drops out after
+    MAX_FAILURES failures in a row; the last healthy one never does.
+    """
+
+    MAX_FAILURES = 3
+
+    def __init__(self, ranked: List[str]):
+        self.ranked = ranked
+        self._fails = dict.fromkeys(ranked, 0)
+        self._bad   = set()
+        self._lock  = threading.Lock()
+
+    def pick(self, slot: int, avoid: Optional[str] = None) -> str:
+        """Mirror for a worker slot, preferring any healthy one other than `avoid`."""
+        with self._lock:
+            healthy = [u for u in self.ranked if u not in self._bad]
+            others  = [u for u in healthy if u != avoid] or healthy
+            return others[slot % len(others)]
+
+    def fail(self, url: str) -> bool:
+        """Count a failure. Returns True when this one took the mirror out of rotation."""
+        with self._lock:
+            self._fails[url] += 1
+            if (self._fails[url] < self.MAX_FAILURES or url in self._bad
+                    or len(self.ranked) - len(self._bad) <= 1):
+                return False
+            self._bad.add(url)
+            return True
+
+    def ok(self, url: str):
+        """A mirror delivered a whole segment: forget its earlier failures."""
+        with self._lock:
+            self._fails[url] = 0
 
 
 class Downloader:
@@ -20,21 +139,41 @@ class Downloader:
     MAX_RETRIES = 3
     RETRY_DELAY = 3  # seconds
 
+    SEGMENT_SIZE     = 16 * 1024 * 1024  # segments are handed to workers in file order
+    STATE_SUFFIX     = ".state"           # per-segment resume map next to the part file
+    STATE_SAVE_EVERY = 16 * 1024 * 1024   # persist resume map every N bytes written
+    HASH_BUFSIZE     = 1024 * 1024
+    PROBE_BYTES      = 256 * 1024         # per-mirror speed test
+    STALL_TIMEOUT    = 15                 # seconds without data before failing over
+
     def __init__(self, log):
-        self.log = log
+        self.log     = log
+        self.digests = {}   # algo -> hexdigest of the last completed download
 
     # ── Checksum ──────────────────────────────────────────────────────────────
 
     def _checksum(self, path: str, algo: str = "sha256") -> str:
-        h = hashlib.new(algo)
         with open(path, "rb") as f:
-            for chunk in iter(lambda: f.read(8192), b""):
-                h.update(chunk)
+            if hasattr(hashlib, "file_digest"):   # Python 3.11+
+                return hashlib.file_digest(f, algo).hexdigest()
+            h    = hashlib.new(algo)
+            buf  = bytearray(self.HASH_BUFSIZE)
+            view = memoryview(buf)
+            while True:
+                n = f.readinto(buf)
+                if not n:
+                    break
+                h.update(view[:n])
         return h.hexdigest()
 
-    def verify(self, path: str, expected: str, algo: str = "sha256") -> bool:
-        self.log.info(f"Verifying {algo.upper()} checksum...")
-        actual = self._checksum(path, algo)
+    def verify(self, path: str, expected: str, algo: str = "sha256",
+               actual: Optional[str] = None) -> bool:
+        """Compare against `expected`; `actual` skips re-reading the file."""
+        if actual:
+            self.log.info(f"Verifying {algo.upper()} checksum (computed while downloading)...")
+        else:
+            self.log.info(f"Verifying {algo.upper()} checksum...")
+            actual = self._checksum(path, algo)
         if actual.lower() == expected.lower():
             self.log.success(f"Checksum OK: {actual[:16]}...")
             return True
@@ -48,22 +187,52 @@ class Downloader:
 
     def download(
         self,
-        url: str,
+        url: Union[str, List[str]],
         dest_dir: str = DEFAULT_DEST,
         filename: Optional[str] = None,
         checksum: Optional[str] = None,
         checksum_algo: str = "sha256",
         resume: bool = True,
+        connections: int = 1,
     ) -> Optional[str]:
         os.makedirs(dest_dir, exist_ok=True)
-        filename = filename or url.split("?")[0].split("/")[-1] or "rom_download"
+        urls     = [url] if isinstance(url, str) else list(url)
+        url      = urls[0]
+        filename = filename or filename_for(url)
         dest     = os.path.join(dest_dir, filename)
         tmp      = dest + ".miflasher_part"
 
         self.log.header("Download")
         self.log.info(f"URL:  {url}")
+        if len(urls) > 1:
+            self.log.info(f"Mirrors: {len(urls) - 1} alternate(s)")
         self.log.info(f"Dest: {dest}")
 
+        self.digests = {}
+        hasher = _StreamHasher(["sha256", checksum_algo])
+
+        # A resume map means a segmented download is in progress — keep going that way
+        resuming = resume and os.path.exists(tmp + self.STATE_SUFFIX)
+        if connections > 1 or resuming:
+            ranked, total = self._rank_mirrors(urls)
+            for attempt in range(2, self.MAX_RETRIES + 1):
+                if ranked or not resuming:
+                    break
+                self.log.warning(f"No mirror answered a ranged request — "
+                                 f"retrying in {self.RETRY_DELAY}s (attempt {attempt})")
+                time.sleep(self.RETRY_DELAY)
+                ranked, total = self._rank_mirrors(urls)
+            if ranked:
+                return self._download_segmented(_MirrorPool(ranked), dest, tmp, total,
+                                                max(connections, 2), resume, hasher,
+                                                checksum, checksum_algo)
+            if resuming:
+                # the part file is preallocated: a single stream would "resume" at its end
+                self.log.error("Cannot resume the segmented download: no mirror answered a "
+                               "ranged request. Run again later to resume.")
+                return None
+            self.log.info("Server does not support ranged requests — using a single stream")
+
         existing = os.path.getsize(tmp) if os.path.exists(tmp) else 0
 
         for attempt in range(1, self.MAX_RETRIES + 1):
@@ -87,6 +256,10 @@ class Downloader:
                     mode  = "ab" if (resume and existing > 0) else "wb"
                     start = time.time()
                     done  = existing
+                    if mode == "ab":
+                        hasher.sync(tmp, existing)
+                    else:
+                        hasher.reset()
 
                     with open(tmp, mode) as f:
                         for chunk in self.log.progress(
@@ -97,25 +270,11 @@ class Downloader:
                         ):
                             if chunk:
                                 f.write(chunk)
+                                hasher.update(chunk)
                                 done += len(chunk)
+                            self.log.checkpoint()
 
-                # Download complete — rename temp file
-                os.replace(tmp, dest)
-                elapsed = max(time.time() - start, 0.001)
-                self.log.success(
-                    f"Download complete: {self._fmt_size(os.path.getsize(dest))} "
-                    f"in {elapsed:.1f}s ({self._fmt_size(os.path.getsize(dest)/elapsed)}/s avg)"
-                )
-
-                # Verify checksum if provided
-                if checksum:
-                    ok = self.verify(dest, checksum, checksum_algo)
-                    if not ok:
-                        self.log.error("Removing corrupt download.")
-                        os.remove(dest)
-                        return None
-
-                return dest
+                return self._finalize(tmp, dest, start, hasher, checksum, checksum_algo)
 
             except requests.exceptions.ConnectionError as e:
                 self.log.warning(f"Connection error: {e}")
@@ -136,6 +295,258 @@ class Downloader:
         self.log.error(f"Download failed after {self.MAX_RETRIES} attempts.")
         return None
 
+    def _finalize(self, tmp: str, dest: str, start: float, hasher: _StreamHasher,
+                  checksum: Optional[str], checksum_algo: str) -> Optional[str]:
+        """Rename the completed part file into place and verify it."""
+        hasher.sync(tmp, os.path.getsize(tmp))
+        self.digests = hasher.hexdigests()
+        os.replace(tmp, dest)
+        elapsed = max(time.time() - start, 0.001)
+        self.log.success(
+            f"Download complete: {self._fmt_size(os.path.getsize(dest))} "
+            f"in {elapsed:.1f}s ({self._fmt_size(os.path.getsize(dest)/elapsed)}/s avg)"
+        )
+
+        # Verify checksum if provided
+        if checksum:
+            ok = self.verify(dest, checksum, checksum_algo,
+                             actual=self.digests.get(checksum_algo))
+            if not ok:
+                self.log.error("Removing corrupt download.")
+                os.remove(dest)
+                return None
+
+        return dest
+
+    # ── Segmented download ────────────────────────────────────────────────────
+
+    def _probe(self, url: str) -> Optional[tuple]:
+        """Fetch the first PROBE_BYTES; returns (total_size, latency, bytes_per_sec)."""
+        try:
+            t0 = time.time()
+            headers = {"Range": f"bytes=0-{self.PROBE_BYTES - 1}"}
+            with requests.get(url, headers=headers, stream=True,
+                              timeout=(10, self.STALL_TIMEOUT)) as r:
+                latency = time.time() - t0
+                crange  = r.headers.get("content-range", "")
+                if r.status_code != 206 or "/" not in crange:
+                    return None
+                total = crange.rsplit("/", 1)[-1]
+                if not total.isdigit():
+                    return None
+                got = sum(len(c) for c in r.iter_content(chunk_size=64 * 1024))
+            elapsed = max(time.time() - t0, 0.001)
+            return int(total), latency, got / elapsed
+        except requests.exceptions.RequestException as e:
+            self.log.debug(f"Probe failed for {url}: {e}")
+            return None
+
+    def _rank_mirrors(self, urls: List[str]) -> tuple:
+        """
+        Probe all mirrors concurrently with small Range requests.
+        Returns (urls ranked fastest first, total size) — ([], None) if none support ranges.
+        """
+        with ThreadPoolExecutor(max_workers=min(len(urls), 8)) as pool:
+            results = list(pool.map(self._probe, urls))
+
+        ok = [(u, r) for u, r in zip(urls, results) if r]
+        if not ok:
+            return [], None
+        # Mirrors must agree with the primary (or first responding) URL on file size
+        total = next((r[0] for u, r in ok if u == urls[0]), ok[0][1][0])
+        ok    = [(u, r) for u, r in ok if r[0] == total]
+        ok.sort(key=lambda item: item[1][2], reverse=True)
+
+        if len(urls) > 1:
+            rows = [[urlparse(u).netloc, f"{r[1] * 1000:.0f} ms", f"{self._fmt_size(r[2])}/s"]
+                    for u, r in ok]
+            self.log.table(["Mirror", "Latency", "Speed"], rows, title="Mirror Ranking")
+        return [u for u, _ in ok], total
+
+    def _load_state(self, tmp: str, total: int) -> Optional[list]:
+        """Per-segment resume map: [[start, end, done], ...] (end exclusive)."""
+        state_path = tmp + self.STATE_SUFFIX
+        if not (os.path.exists(state_path) and os.path.exists(tmp)):
+            return None
+        try:
+            with open(state_path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if state.get("size") != total or os.path.getsize(tmp) != total:
+            self.log.warning("Remote file changed since last attempt — starting over")
+            return None
+        return state["segments"]
+
+    def _save_state(self, tmp: str, urls: List[str], total: int, segments: list):
+        state_path = tmp + self.STATE_SUFFIX
+        with open(state_path + ".new", "w") as f:
+            json.dump({"urls": urls, "size": total, "segments": segments}, f)
+        os.replace(state_path + ".new", state_path)
+
+    def _fetch_segment(self, session: requests.Session, mirrors: _MirrorPool, slot: int,
+                       seg: list, idx: int, out: queue.Queue, stop: threading.Event):
+        """
+        Stream one byte range into the writer queue. A drop, stall or error is
+        counted against the mirror and the segment continues from the current
+        offset on another mirror (or, with only one left, after RETRY_DELAY).
+        """
+        offset   = seg[0] + seg[2]
+        end      = seg[1]
+        url      = mirrors.pick(slot)
+        attempts = self.MAX_RETRIES * len(mirrors.ranked)
+        for attempt in range(1, attempts + 1):
+            try:
+                headers = {"Range": f"bytes={offset}-{end - 1}"}
+                with session.get(url, headers=headers, stream=True,
+                                 timeout=(10, self.STALL_TIMEOUT)) as r:
+                    r.raise_for_status()
+                    if r.status_code != 206:
+                        raise requests.exceptions.HTTPError("server ignored Range request")
+                    for chunk in r.iter_content(chunk_size=self.CHUNK_SIZE):
+                        if stop.is_set():
+                            return
+                        chunk = chunk[:end - offset]
+                        out.put(("data", idx, offset, chunk))
+                        offset += len(chunk)
+                        if offset >= end:
+                            mirrors.ok(url)
+                            return
+                raise requests.exceptions.ConnectionError("connection closed mid-segment")
+            except requests.exceptions.RequestException as e:
+                if stop.is_set() or attempt >= attempts:
+                    raise
+                host = urlparse(url).netloc
+                if mirrors.fail(url):
+                    self.log.warning(f"{host} keeps failing — dropping it from the mirror list")
+                new = mirrors.pick(slot, avoid=url)
+                if new != url:
+                    self.log.warning(f"Segment {idx + 1}: {host} failed ({type(e).__name__}) "
+                                     f"— switching to {urlparse(new).netloc}")
+                    url = new
+                else:
+                    self.log.warning(f"Segment {idx + 1}: {host} failed ({type(e).__name__}) "
+                                     f"— retrying in {self.RETRY_DELAY}s")
+                    time.sleep(self.RETRY_DELAY)
+
+    def _segment_worker(self, mirrors: _MirrorPool, slot: int, segments: list, todo: deque,
+                        lock: threading.Lock, out: queue.Queue, stop: threading.Event):
+        """Worker: take the lowest pending segment, fetch it, repeat."""
+        session = requests.Session()
+        idx     = 0
+        try:
+            while not stop.is_set():
+                with lock:
+                    if not todo:
+                        break
+                    idx = todo.popleft()
+                self._fetch_segment(session, mirrors, slot, segments[idx], idx, out, stop)
+        except Exception as e:
+            out.put(("error", idx, None, e))
+        finally:
+            session.close()
+            out.put(("exit", None, None, None))
+
+    def _download_segmented(self, mirrors: _MirrorPool, dest: str, tmp: str, total: int,
+                            connections: int, resume: bool, hasher: _StreamHasher,
+                            checksum: Optional[str], checksum_algo: str) -> Optional[str]:
+        segments = self._load_state(tmp, total) if resume else None
+        if segments:
+            done = sum(s[2] for s in segments)
+            self.log.info(f"Resuming {len(segments)} segment(s) from {self._fmt_size(done)}")
+        else:
+            step = self.SEGMENT_SIZE
+            segments = [[i, min(i + step, total), 0] for i in range(0, total, step)]
+            with open(tmp, "wb") as f:
+                f.truncate(total)  # pre-allocate so every segment can write in place
+            self._save_state(tmp, mirrors.ranked, total, segments)
+
+        todo    = deque(i for i, s in enumerate(segments) if s[0] + s[2] < s[1])
+        count   = min(connections, len(todo))
+        self.log.info(f"Segmented download: {self._fmt_size(total)} in {len(todo)} segment(s) "
+                      f"over {count} connection(s), {min(count, len(mirrors.ranked))} mirror(s)")
+
+        out     = queue.Queue(maxsize=connections * 4)
+        stop    = threading.Event()
+        lock    = threading.Lock()
+        workers = [threading.Thread(target=self._segment_worker,
+                                    args=(mirrors, slot, segments, todo, lock, out, stop),
+                                    daemon=True)
+                   for slot in range(count)]
+        for w in workers:
+            w.start()
+
+        starts  = [s[0] for s in segments]
+        failed  = []
+        start   = time.time()
+        unsaved = 0
+
+        def hashed_frontier() -> int:
+            """End of the contiguous run of written bytes starting at hasher.offset."""
+            pos = hasher.offset
+            i   = bisect.bisect_right(starts, pos) - 1
+            while 0 <= i < len(segments):
+                seg_start, seg_end, seg_done = segments[i]
+                pos = max(pos, seg_start + seg_done)
+                if seg_start + seg_done < seg_end:
+                    break
+                i += 1
+            return pos
+
+        def writer(fd):
+            nonlocal unsaved
+            active = len(workers)
+            while active:
+                kind, idx, offset, payload = out.get()
+                if kind == "data":
+                    os.pwrite(fd, payload, offset)
+                    segments[idx][2] += len(payload)
+                    # Hash in order: straight from memory when this chunk is next,
+                    # otherwise catch up from (page-cached) disk once the gap fills
+                    if offset == hasher.offset:
+                        hasher.update(payload)
+                    if hasher.offset >= offset:
+                        hasher.feed_file(fd, hashed_frontier())
+                    unsaved += len(payload)
+                    if unsaved >= self.STATE_SAVE_EVERY:
+                        self._save_state(tmp, mirrors.ranked, total, segments)
+                        unsaved = 0
+                    yield payload
+                elif kind == "error":
+                    failed.append(idx)
+                    stop.set()
+                    self.log.warning(f"Segment {idx + 1} failed: {payload}")
+                else:
+                    active -= 1
+
+        fd = os.open(tmp, os.O_RDWR)
+        try:
+            hasher.feed_file(fd, hashed_frontier())
+            remaining = total - sum(s[2] for s in segments)
+            for _ in self.log.progress(writer(fd), desc="Downloading", total=remaining, unit="B"):
+                self.log.checkpoint()      # the finally below saves the resume map
+        except KeyboardInterrupt:
+            self.log.warning("Download paused. Run again to resume.")
+            failed.append(-1)
+        finally:
+            stop.set()
+            for w in workers:          # drain so no worker stays blocked on a full queue
+                while w.is_alive():
+                    try:
+                        out.get_nowait()
+                    except queue.Empty:
+                        w.join(0.1)
+            os.close(fd)
+            self._save_state(tmp, mirrors.ranked, total, segments)
+
+        if failed or any(s[0] + s[2] < s[1] for s in segments):
+            if -1 not in failed:
+                self.log.error("Download incomplete — run again to resume the remaining segments.")
+            return None
+
+        os.remove(tmp + self.STATE_SUFFIX)
+        return self._finalize(tmp, dest, start, hasher, checksum, checksum_algo)
+
     # ── Helpers ───────────────────────────────────────────────────────────────
 
     @staticmethod
@@ -147,8 +558,32 @@ class Downloader:
         return f"{b:.1f} PB"
 
 
-def download_rom(url: str, log, dest_dir: str = DEFAULT_DEST,
-                 checksum: str = None) -> Optional[str]:
-    """Convenience wrapper used by flash.py and the CLI."""
+def download_rom(url: Union[str, List[str]], log, dest_dir: str = DEFAULT_DEST,
+                 checksum: str = None, connections: int = DEFAULT_CONNECTIONS,
+                 mirrors: Optional[List[str]] = None, use_cache: bool = True) -> Optional[str]:
+    """
+    Convenience wrapper used by flash.py and the CLI.
+    Served from the local ROM cache when this URL (or sha256 checksum) was fetched before.
+    Xiaomi CDN alternates are added only with `xiaomi_mirrors` on and no explicit mirrors.
+    """
+    from core.cache import RomCache
+
+    urls = ([url] if isinstance(url, str) else list(url)) + list(mirrors or [])
+    dest = os.path.join(dest_dir, filename_for(urls[0]))
+    cache = RomCache(log) if use_cache else None
+
+    if cache:
+        sha256 = checksum if checksum and len(checksum) == 64 else None
+        digest = cache.lookup(urls=None if sha256 else urls, digest=sha256)
+        if digest:
+            log.success(f"ROM cache hit ({digest[:16]}...) — skipping download")
+            return cache.materialize(digest, dest)
+
+    if not mirrors and load_config()["xiaomi_mirrors"]:
+        urls = expand_mirrors(urls)
+
     d = Downloader(log)
-    return d.download(url, dest_dir=dest_dir, checksum=checksum)
+    path = d.download(urls, dest_dir=dest_dir, checksum=checksum, connections=connections)
+    if path and cache and d.digests.get("sha256"):
+        path = cache.add(path, d.digests["sha256"], urls)
+    return path
@@ -0,0 +1,59 @@
+"""
+MiFlasher Event Bus
+One numbered stream of everything a live dashboard shows — job log lines,
+progress ticks, job status and device changes. Events are kept in a bounded
+ring; readers hold the id of the last event they saw (the SSE Last-Event-ID)
+and block until something newer arrives, so an idle or reconnecting client
+costs nothing and never re-reads what it already has.
+"""
+
+import threading
+from collections import deque
+from dataclasses import dataclass
+from itertools import islice
+from typing import List, Tuple
+
+
+@dataclass
+class Event:
+    id:   int
+    kind: str       # log | progress | job | device
+    data: dict
+
+
+class EventBus:
+
+    CAPACITY = 1000   # events kept for reconnecting readers
+
+    def __init__(self, capacity: int = CAPACITY):
+        self._events = deque(maxlen=capacity)
+        self._seq    = 0
+        self._cond   = threading.Condition()
+
+    @property
+    def cursor(self) -> int:
+        """Id of the newest event (0 before the first)."""
+        return self._seq
+
+    def publish(self, kind: str, data: dict) -> int:
+        with self._cond:
+            self._seq += 1
+            self._events.append(Event(self._seq, kind, data))
+            self._cond.notify_all()
+            return self._seq
+
+    def wait(self, cursor: int, timeout: float = None) -> Tuple[int, List[Event], bool]:
+        """
+        (new cursor, events after `cursor`, missed) — blocks up to `timeout`
+        seconds for something new. `missed` is True when events the reader
+        never saw were already dropped (or the cursor is from an earlier
+        server), so it should reload its state instead of applying deltas.
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq != cursor, timeout)
+            if cursor > self._seq:
+                return self._seq, [], True
+            first  = self._events[0].id if self._events else self._seq + 1
+            missed = cursor < first - 1
+            start  = max(cursor - first + 1, 0)
+            return self._seq, list(islice(self._events, start, None)), missed
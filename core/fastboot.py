@@ -0,0 +1,299 @@
+"""
+MiFlasher Fastboot Client
+In-process implementation of the fastboot wire protocol — getvar, download,
+flash, erase, set_active, reboot — over a pluggable transport.
+Images are mmap'd and pushed as memoryview slices (no copies), with progress
+and MB/s reported through the logger; oversized images go out as sparse pieces.
+
+Transports: TcpTransport (fastboot over network, `-s tcp:HOST[:PORT]`) and
+SocketTransport (any connected packet socket, e.g. a socketpair with a fake
+device on the other end).
+"""
+
+import mmap
+import os
+import socket
+import struct
+import time
+from typing import Tuple
+
+from core.device import FastbootVars
+from core.sparse import SparseImage, SparseError
+
+
+FB_PORT      = 5554
+RESPONSE_MAX = 256     # device responses: 4-byte status + message (64 bytes on old bootloaders)
+
+
+class FastbootError(Exception):
+    """The device answered FAIL, or the conversation broke mid-command."""
+
+
+# ── Transports ────────────────────────────────────────────────────────────────
+
+class Transport:
+    """Moves whole fastboot packets between host and device."""
+
+    def send(self, data) -> None:
+        raise NotImplementedError
+
+    def recv(self, size: int = RESPONSE_MAX) -> bytes:
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class SocketTransport(Transport):
+    """
+    Packets over a connected socket that keeps message boundaries, the way USB
+    bulk transfers do — e.g. socket.socketpair(AF_UNIX, SOCK_SEQPACKET).
+    """
+
+    def __init__(self, sock: socket.socket, max_packet: int = 0):
+        self.sock       = sock
+        self.max_packet = max_packet   # split writes (AF_UNIX datagrams are size-limited)
+
+    def send(self, data) -> None:
+        if not self.max_packet or len(data) <= self.max_packet:
+            self.sock.sendall(data)
+            return
+        with memoryview(data) as view:
+            for off in range(0, len(view), self.max_packet):
+                self.sock.sendall(view[off:off + self.max_packet])
+
+    def recv(self, size: int = RESPONSE_MAX) -> bytes:
+        data = self.sock.recv(size)
+        if not data:
+            raise FastbootError("Connection closed by device")
+        return data
+
+    def close(self):
+        self.sock.close()
+
+
+class TcpTransport(SocketTransport):
+    """fastboot over TCP: "FB01" handshake, then each packet prefixed by its 64-bit length."""
+
+    HANDSHAKE = b"FB01"
+
+    def __init__(self, host: str, port: int = FB_PORT, timeout: float = 30):
+        super().__init__(socket.create_connection((host, port), timeout=timeout))
+        self.sock.sendall(self.HANDSHAKE)
+        reply = self._read_exact(4)
+        if not reply.startswith(b"FB"):
+            self.close()
+            raise FastbootError(f"Bad fastboot handshake from {host}:{port}: {reply!r}")
+
+    def _read_exact(self, n: int) -> bytes:
+        buf = bytearray()
+        while len(buf) < n:
+            chunk = self.sock.recv(n - len(buf))
+            if not chunk:
+                raise FastbootError("Connection closed by device")
+            buf += chunk
+        return bytes(buf)
+
+    def send(self, data) -> None:
+        self.sock.sendall(struct.pack(">Q", len(data)))
+        self.sock.sendall(data)
+
+    def recv(self, size: int = RESPONSE_MAX) -> bytes:
+        (n,) = struct.unpack(">Q", self._read_exact(8))
+        return self._read_exact(n)
+
+
+def open_transport(serial: str) -> Transport:
+    """Transport for a fastboot serial such as "tcp:192.168.1.5" or "tcp:host:5555"."""
+    kind, _, addr = serial.partition(":")
+    if kind != "tcp" or not addr:
+        raise FastbootError(f"Built-in client only supports tcp: serials (got {serial})")
+    host, _, port = addr.partition(":")
+    return TcpTransport(host, int(port) if port else FB_PORT)
+
+
+def is_network_serial(serial) -> bool:
+    return bool(serial) and serial.startswith("tcp:")
+
+
+# ── Client ────────────────────────────────────────────────────────────────────
+
+class FastbootClient:
+
+    CHUNK_SIZE = 1024 * 1024   # bytes per transport write while downloading
+
+    def __init__(self, transport: Transport, log):
+        self.t    = transport
+        self.log  = log
+        self.info = []         # INFO/TEXT lines of the last command
+        self._max_download = None
+
+    @classmethod
+    def connect(cls, serial: str, log) -> "FastbootClient":
+        return cls(open_transport(serial), log)
+
+    def close(self):
+        self.t.close()
+
+    # ── Protocol ──────────────────────────────────────────────────────────────
+
+    def _response(self) -> Tuple[str, str]:
+        """Read packets until OKAY / DATA; INFO & TEXT are collected, FAIL raises."""
+        while True:
+            pkt    = self.t.recv(RESPONSE_MAX)
+            status = pkt[:4].decode("ascii", "replace")
+            msg    = pkt[4:].decode("utf-8", "replace")
+            if status in ("INFO", "TEXT"):
+                self.info.append(msg)
+                self.log.debug(f"(bootloader) {msg}")
+            elif status == "FAIL":
+                raise FastbootError(msg or "remote failure")
+            elif status in ("OKAY", "DATA"):
+                return status, msg
+            else:
+                raise FastbootError(f"Unexpected response: {pkt[:64]!r}")
+
+    def command(self, cmd: str) -> str:
+        """Send one command and wait for OKAY; returns its message."""
+        self.info = []
+        self.t.send(cmd.encode())
+        status, msg = self._response()
+        if status != "OKAY":
+            raise FastbootError(f"{cmd}: unexpected {status}")
+        return msg
+
+    # ── Commands ──────────────────────────────────────────────────────────────
+
+    def getvar(self, name: str) -> str:
+        return self.command(f"getvar:{name}")
+
+    def getvar_all(self) -> FastbootVars:
+        self.command("getvar:all")
+        return FastbootVars.parse("\n".join(f"(bootloader) {line}" for line in self.info))
+
+    def max_download_size(self) -> int:
+        """Device download buffer in bytes (0 when it doesn't say)."""
+        if self._max_download is None:
+            try:
+                self._max_download = int(self.getvar("max-download-size"), 0)
+            except (FastbootError, ValueError):
+                self._max_download = 0
+        return self._max_download
+
+    def download(self, data, desc: str = "Sending"):
+        """Upload one buffer (bytes, mmap, memoryview) into the device's download area."""
+        with memoryview(data).cast("B") as view:
+            self.download_stream(len(view), [view], desc=desc)
+
+    def download_stream(self, size: int, buffers, desc: str = "Sending"):
+        """
+        Upload `size` bytes given as an iterable of buffers, sent in CHUNK_SIZE
+        memoryview slices so nothing is copied and progress stays smooth.
+        """
+        limit = self.max_download_size()
+        if limit and size > limit:
+            raise FastbootError(f"{_fmt_size(size)} exceeds max-download-size "
+                                f"({_fmt_size(limit)})")
+
+        self.info = []
+        self.t.send(f"download:{size:08x}".encode())
+        status, _ = self._response()
+        if status != "DATA":
+            raise FastbootError(f"download: unexpected {status}")
+
+        def slices():
+            for buf in buffers:
+                with memoryview(buf).cast("B") as view:
+                    for off in range(0, len(view), self.CHUNK_SIZE):
+                        with view[off:off + self.CHUNK_SIZE] as chunk:
+                            yield chunk
+
+        start, sent = time.time(), 0
+        chunks = slices()
+        try:
+            for chunk in self.log.progress(chunks, desc=desc, total=size):
+                self.t.send(chunk)
+                sent += len(chunk)
+        finally:
+            chunks.close()   # releases the live slice even on error, so an mmap can close
+            if hasattr(buffers, "close"):
+                buffers.close()
+        if sent != size:
+            raise FastbootError(f"download: sent {sent} of {size} bytes")
+        status, _ = self._response()
+        if status != "OKAY":
+            raise FastbootError(f"download: unexpected {status}")
+
+        elapsed = max(time.time() - start, 1e-3)
+        self.log.info(f"Sent {_fmt_size(size)} in {elapsed:.1f}s "
+                      f"({size / elapsed / 1024 ** 2:.1f} MB/s)")
+
+    def flash(self, partition: str, path: str):
+        """
+        Flash an image file. Small raw images are sent straight from an mmap;
+        sparse images and raw images over max-download-size go through flash_sparse.
+        """
+        size = os.path.getsize(path)
+        if size == 0:
+            raise FastbootError(f"Empty image: {path}")
+        limit = self.max_download_size()
+        if SparseImage.is_sparse(path) or (limit and size > limit):
+            self.flash_sparse(partition, path)
+            return
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            self.download(mm, desc=f"Sending {partition}")
+        self.command(f"flash:{partition}")
+
+    def flash_sparse(self, partition: str, path: str):
+        """
+        Flash as sparse pieces that each fit in max-download-size (raw images
+        converted on the fly).
+        """
+        try:
+            img    = SparseImage.open(path)
+            pieces = img.split(self.max_download_size())
+        except SparseError as e:
+            raise FastbootError(f"{os.path.basename(path)}: {e}")
+        self.log.info(f"{partition}: {_fmt_size(img.raw_size)} raw → "
+                      f"{_fmt_size(img.sparse_size())} sparse, {len(pieces)} piece(s)")
+        with img:
+            for i, chunks in enumerate(pieces, 1):
+                size, buffers = img.piece(chunks)
+                self.download_stream(size, buffers, desc=f"Sending {partition} {i}/{len(pieces)}")
+                self.command(f"flash:{partition}")
+
+    def erase(self, partition: str):
+        self.command(f"erase:{partition}")
+
+    def set_active(self, slot: str):
+        self.command(f"set_active:{slot.lstrip('_')}")
+
+    def reboot(self, target: str = ""):
+        """reboot, or reboot-bootloader / reboot-recovery / reboot-fastboot."""
+        self.command(f"reboot-{target}" if target else "reboot")
+
+    def run(self, *args) -> str:
+        """Execute fastboot CLI-style arguments, e.g. run("flash", "boot_a", "boot.img")."""
+        cmd, rest = args[0], list(args[1:])
+        if cmd == "flash":
+            self.flash(rest[0], rest[1])
+        elif cmd == "erase":
+            self.erase(rest[0])
+        elif cmd == "getvar":
+            return self.getvar(rest[0])
+        elif cmd == "set_active" or cmd.startswith("--set-active="):
+            self.set_active(rest[0] if rest else cmd.split("=", 1)[1])
+        elif cmd == "reboot":
+            self.reboot(rest[0] if rest else "")
+        elif cmd.startswith("reboot-"):
+            self.reboot(cmd[len("reboot-"):])
+        else:
+            raise FastbootError(f"Not supported by the built-in client: {cmd}")
+        return ""
+
+
+def _fmt_size(b: float) -> str:
+    for u in ("B", "KB", "MB", "GB"):
+        if b < 1024: return f"{b:.1f} {u}"
+        b /= 1024
+    return f"{b:.1f} TB"
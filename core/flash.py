@@ -5,26 +5,48 @@ Supports: A/B slots, checksum verification, pre/post-flash hooks, auto-detect mo
 """
 
 import os
+import re
+import queue
+import hashlib
 import subprocess
+import tempfile
+import threading
 import zipfile
 import tarfile
 import shutil
 import time
 from pathlib import Path
-from typing import Optional
+from typing import Optional, Tuple
 
-from core.downloader import download_rom
-from core.device import DeviceManager
+from core.cache import ExtractCache
+from core.downloader import download_rom, DEFAULT_CONNECTIONS
+from core.device import DeviceCache, DeviceManager
+from core.fastboot import FastbootClient, FastbootError, is_network_serial
+from core.payload import PayloadExtractor
+from core.sparse import SparseImage, SparseError
 
 
 TEMP_DIR = os.path.expanduser("~/storage/downloads/MiFlasher/extracted")
 
+# Partitions flash_all_except_data_storage.sh leaves alone
+DATA_PARTITIONS = ("userdata", "metadata")
+
+# `fastboot $* flash <partition> <image> [|| { echo ...; exit 1; }]` in flash_all*.sh
+_SCRIPT_FLASH = re.compile(r"^fastboot(?:\s+(?:\$\*|\$@|\"\$@\"))?\s+flash\s+(\S+)\s+"
+                           r"((?:`dirname \$0`|\$\(dirname \$0\))?\S+)"
+                           r"\s*(?:\|\|\s*(?:\{[^}]*\}|exit\s+\d+))?\s*$")
+_SCRIPT_DIR   = re.compile(r"^(?:`dirname \$0`|\$\(dirname \$0\))/?")
+
 
 class FlashManager:
 
-    def __init__(self, log):
-        self.log  = log
-        self.dev  = DeviceManager(log)
+    STREAM_WINDOW = 2          # images on disk at once while stream-flashing
+    COPY_BUFSIZE  = 1024 * 1024
+
+    def __init__(self, log, serial: Optional[str] = None):
+        self.log    = log
+        self.serial = serial
+        self.dev    = DeviceManager(log, serial)
 
     # ── Helpers ───────────────────────────────────────────────────────────────
 
@@ -52,11 +74,28 @@ class FlashManager:
             return -1, "", "not found"
 
     def _fastboot(self, *args, desc="") -> bool:
-        rc, _, _ = self._run(["fastboot", *args], desc=desc)
+        if is_network_serial(self.serial):
+            return self._fastboot_native(*args, desc=desc)
+        rc, _, _ = self._run(self.dev._pinned(["fastboot", *args]), desc=desc)
         return rc == 0
 
+    def _fastboot_native(self, *args, desc="") -> bool:
+        """Network devices go through the built-in client (streaming progress + MB/s)."""
+        if desc:
+            self.log.info(f"  $ fastboot {' '.join(args)}  [built-in]")
+        try:
+            client = FastbootClient.connect(self.serial, self.log)
+            try:
+                client.run(*args)
+            finally:
+                client.close()
+            return True
+        except (FastbootError, OSError) as e:
+            self.log.error(f"fastboot {' '.join(args)} failed: {e}")
+            return False
+
     def _adb(self, *args, desc="") -> bool:
-        rc, _, _ = self._run(["adb", *args], desc=desc)
+        rc, _, _ = self._run(self.dev._pinned(["adb", *args]), desc=desc)
         return rc == 0
 
     def _require_device(self, mode: str = "any") -> bool:
@@ -73,34 +112,227 @@ class FlashManager:
             return False
         return True
 
-    def _extract_zip(self, path: str) -> str:
+    def _copy_hashed(self, src, dst: str) -> dict:
+        """Copy a file object to dst, hashing on the way. Returns manifest metadata."""
+        h, size = hashlib.sha256(), 0
+        with open(dst, "wb") as f:
+            while True:
+                chunk = src.read(self.COPY_BUFSIZE)
+                if not chunk:
+                    break
+                f.write(chunk)
+                h.update(chunk)
+                size += len(chunk)
+        return {"size": size, "sha256": h.hexdigest()}
+
+    def _member_path(self, out_dir: str, name: str) -> Optional[str]:
+        dst = os.path.normpath(os.path.join(out_dir, name))
+        if not dst.startswith(os.path.normpath(out_dir) + os.sep):
+            self.log.warning(f"Skipping unsafe archive member: {name}")
+            return None
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        return dst
+
+    def _extract_zip(self, path: str, out_dir: str) -> dict:
+        """Extract into out_dir; returns {relpath: {size[, sha256]}} for the manifest."""
         self.log.info("Extracting ZIP archive...")
-        out_dir = os.path.join(TEMP_DIR, Path(path).stem)
-        os.makedirs(out_dir, exist_ok=True)
+        files = {}
         with zipfile.ZipFile(path) as z:
-            members = z.namelist()
+            members = z.infolist()
             for i, member in enumerate(members, 1):
-                self.log.progress.__doc__  # silence; we draw manually
-                z.extract(member, out_dir)
+                self.log.checkpoint()
+                if member.is_dir():
+                    z.extract(member, out_dir)
+                elif member.filename.endswith(".img"):
+                    dst = self._member_path(out_dir, member.filename)
+                    if dst:
+                        with z.open(member) as src:
+                            files[member.filename] = self._copy_hashed(src, dst)
+                else:
+                    z.extract(member, out_dir)
+                    files[member.filename] = {"size": member.file_size}
                 pct = i / len(members) * 100
                 print(f"\r  Extracting... {pct:5.1f}% [{i}/{len(members)}]", end="", flush=True)
         print()
         self.log.success(f"Extracted to: {out_dir}")
-        return out_dir
+        return files
 
-    def _extract_tgz(self, path: str) -> str:
+    def _extract_tgz(self, path: str, out_dir: str) -> dict:
+        """Extract into out_dir; returns {relpath: {size[, sha256]}} for the manifest."""
         self.log.info("Extracting TAR archive...")
-        out_dir = os.path.join(TEMP_DIR, Path(path).stem.replace(".tar", ""))
-        os.makedirs(out_dir, exist_ok=True)
+        files = {}
         with tarfile.open(path) as t:
             members = t.getmembers()
             for i, member in enumerate(members, 1):
-                t.extract(member, out_dir, set_attrs=False)
+                self.log.checkpoint()
+                if member.isfile() and member.name.endswith(".img"):
+                    dst = self._member_path(out_dir, member.name)
+                    if dst:
+                        files[member.name] = self._copy_hashed(t.extractfile(member), dst)
+                else:
+                    t.extract(member, out_dir, set_attrs=False)
+                    if member.isfile():
+                        files[member.name] = {"size": member.size}
                 pct = i / len(members) * 100
                 print(f"\r  Extracting... {pct:5.1f}% [{i}/{len(members)}]", end="", flush=True)
         print()
         self.log.success(f"Extracted to: {out_dir}")
-        return out_dir
+        return files
+
+    def _extract_to_cache(self, path: str) -> Optional[str]:
+        """
+        Extract a ROM archive into the extract cache; returns the tree (in use
+        until ExtractCache.release) or None.
+        """
+        cache   = ExtractCache(self.log, TEMP_DIR)
+        rom_dir = cache.begin(path)
+        try:
+            if path.lower().endswith(".zip"):
+                files = self._extract_zip(path, rom_dir)
+            else:
+                files = self._extract_tgz(path, rom_dir)
+        except (OSError, zipfile.BadZipFile, tarfile.TarError) as e:
+            print()
+            self.log.error(f"Extraction failed: {e}")
+            self.log.info(f"Cleaning up temp: {rom_dir}")
+            cache.release(rom_dir)
+            return None
+        except BaseException:
+            cache.release(rom_dir)          # cancelled: drop the partial tree
+            raise
+        cache.commit(path, rom_dir, files)
+        return rom_dir
+
+    @staticmethod
+    def _script_candidates(keep_data: bool) -> list:
+        if keep_data:
+            return ["flash_all_except_data_storage.sh"]
+        return ["flash_all.sh", "flash_all_lock.sh"]
+
+    @staticmethod
+    def _parse_flash_script(text: str) -> Optional[list]:
+        """
+        [(partition, image path relative to the script)] in the order a Xiaomi
+        flash_all*.sh flashes them, or None when the script does anything
+        besides plain `fastboot flash` — anti-rollback / product checks, erase,
+        set_active, oem lock — which only running the script itself reproduces.
+        """
+        plan = []
+        for line in text.splitlines():
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            m = _SCRIPT_FLASH.match(line)
+            if not m:
+                return None
+            image = _SCRIPT_DIR.sub("", m.group(2)).strip("`'\"").replace("\\", "/")
+            if "$" in image or "`" in image:
+                return None
+            plan.append((m.group(1), os.path.normpath(image)))
+        return plan
+
+    def _archive_listing(self, path: str, scripts: list) -> Tuple[list, dict]:
+        """
+        (file members in archive order, {member: text} for the named scripts).
+        ZIP archives list from the central directory; TAR archives need a pass
+        through the (decompressed) stream, which writes nothing to disk.
+        """
+        members, texts = [], {}
+        if path.lower().endswith(".zip"):
+            with zipfile.ZipFile(path) as z:
+                for info in z.infolist():
+                    if info.is_dir():
+                        continue
+                    members.append(os.path.normpath(info.filename))
+                    if os.path.basename(info.filename) in scripts:
+                        texts[members[-1]] = z.read(info).decode("utf-8", "replace")
+        else:
+            with tarfile.open(path, "r|*") as t:
+                for member in t:
+                    if not member.isfile():
+                        continue
+                    members.append(os.path.normpath(member.name))
+                    if os.path.basename(member.name) in scripts:
+                        texts[members[-1]] = t.extractfile(member).read().decode("utf-8", "replace")
+        return members, texts
+
+    def _stream_plan(self, path: str, keep_data: bool) -> Optional[list]:
+        """
+        [(partition, archive member)] to stream-flash, or None when streaming
+        can't do what the extract path would (the caller extracts instead).
+        With a flash script, it must consist of plain flash lines only; a TAR
+        archive must also hold the images in the order the script flashes
+        them. Without one, every .img is flashed, minus DATA_PARTITIONS when
+        keep_data is set.
+        """
+        candidates = self._script_candidates(keep_data)
+        try:
+            members, texts = self._archive_listing(path, candidates)
+        except (OSError, zipfile.BadZipFile, tarfile.TarError) as e:
+            self.log.error(f"Cannot read archive: {e}")
+            return None
+
+        scripts = {os.path.basename(m): m for m in texts}
+        script  = next((scripts[c] for c in candidates if c in scripts), None)
+        if script:
+            steps = self._parse_flash_script(texts[script])
+            if steps is None:
+                self.log.warning(f"{os.path.basename(script)} runs more than flash commands "
+                                 f"(checks, erase, set_active, lock) — extracting instead")
+                return None
+            base = os.path.dirname(script)
+            plan = [(part, os.path.normpath(os.path.join(base, rel))) for part, rel in steps]
+            absent = [m for _, m in plan if m not in members]
+            if absent:
+                self.log.warning(f"{os.path.basename(script)} flashes files that are not in the "
+                                 f"archive ({', '.join(absent)}) — extracting instead")
+                return None
+            self.log.info(f"Following {os.path.basename(script)}")
+        else:
+            skip  = DATA_PARTITIONS if keep_data else ()
+            imgs  = [m for m in members if m.endswith(".img")]
+            stems = [Path(m).stem for m in imgs]
+            dupes = sorted({s for s in stems if stems.count(s) > 1})
+            if dupes:
+                self.log.warning(f"Several images named {', '.join(dupes)} in the archive "
+                                 f"— extracting instead")
+                return None
+            if keep_data:
+                self.log.info(f"Keeping data: skipping {', '.join(DATA_PARTITIONS)}")
+            if path.lower().endswith(".zip"):
+                imgs = sorted(imgs, key=os.path.basename)
+            plan = [(Path(m).stem, m) for m in imgs if Path(m).stem not in skip]
+
+        if not path.lower().endswith(".zip"):
+            # a TAR stream yields each member once, in archive order
+            order = [members.index(m) for _, m in plan]
+            if order != sorted(set(order)):
+                self.log.warning("TAR archive order differs from the flash order "
+                                 "— extracting instead")
+                return None
+        return plan
+
+    def _iter_archive_images(self, path: str, plan: list):
+        """
+        Yield (partition, member, fileobj, size) for every plan entry without
+        extracting anything: ZIP members in plan order, TAR members as the
+        stream reaches them (_stream_plan made sure that is plan order).
+        """
+        if path.lower().endswith(".zip"):
+            with zipfile.ZipFile(path) as z:
+                infos = {os.path.normpath(i.filename): i for i in z.infolist() if not i.is_dir()}
+                for partition, name in plan:
+                    with z.open(infos[name]) as src:
+                        yield partition, name, src, infos[name].file_size
+        else:
+            pending = list(plan)
+            with tarfile.open(path, "r|*") as t:
+                for member in t:
+                    if not (pending and member.isfile()):
+                        continue
+                    if os.path.normpath(member.name) == pending[0][1]:
+                        partition, name = pending.pop(0)
+                        yield partition, name, t.extractfile(member), member.size
 
     def _cleanup(self, path: str):
         if os.path.isdir(path):
@@ -116,7 +348,10 @@ class FlashManager:
         # Download if URL
         if is_url:
             self.log.info(f"Source is URL, downloading first...")
-            source = download_rom(source, self.log)
+            source = download_rom(source, self.log,
+                                  connections=opts.get("connections", DEFAULT_CONNECTIONS),
+                                  mirrors=opts.get("mirrors"),
+                                  use_cache=not opts.get("no_cache"))
             if not source:
                 self.log.error("Download failed. Aborting flash.")
                 return False
@@ -143,8 +378,11 @@ class FlashManager:
             self.log.error(f"Unknown flash target: {target}")
             return False
 
+        self.log.checkpoint()
         success = fn(source, target=target, **opts)
 
+        # slot, versions and partition layout may all have changed
+        DeviceCache.invalidate(self.serial)
         elapsed = time.time() - start_time
         if success:
             self.log.success(f"Flash complete in {elapsed:.1f}s 🎉")
@@ -164,25 +402,34 @@ class FlashManager:
         if not self._require_device("fastboot"):
             return False
 
-        # Extract
         ext = Path(path).suffix.lower()
-        if ext in (".zip",):
-            rom_dir = self._extract_zip(path)
-        elif ext in (".gz", ".tgz") or path.endswith(".tar.gz"):
-            rom_dir = self._extract_tgz(path)
-        else:
+        if ext not in (".zip", ".gz", ".tgz"):
             self.log.error(f"Unsupported ROM format: {ext}")
             return False
 
-        # Find flash script
-        candidates = []
-        if keep_data:
-            candidates = ["flash_all_except_data_storage.sh"]
-        else:
-            candidates = ["flash_all.sh", "flash_all_lock.sh"]
+        cache  = ExtractCache(self.log, TEMP_DIR)
+        cached = cache.lookup(path)
+        if opts.get("stream") and not cached:
+            plan = self._stream_plan(path, keep_data)
+            if plan is not None:
+                self.log.info("Streaming mode — flashing images straight from the archive")
+                return self._stream_flash_archive(path, plan, slot=slot)
+
+        # Extract (or reuse the tree from a previous flash of the same archive)
+        rom_dir = cached or self._extract_to_cache(path)
+        if not rom_dir:
+            return False
+        if cached:
+            self.log.success(f"Using cached extraction: {rom_dir}")
+        try:
+            return self._flash_rom_tree(rom_dir, keep_data, slot)
+        finally:
+            cache.release(rom_dir)
 
+    def _flash_rom_tree(self, rom_dir: str, keep_data: bool, slot: str) -> bool:
+        # Find flash script
         script_path = None
-        for c in candidates:
+        for c in self._script_candidates(keep_data):
             p = os.path.join(rom_dir, c)
             if os.path.exists(p):
                 script_path = p
@@ -190,15 +437,17 @@ class FlashManager:
 
         if script_path:
             self.log.step(1, 1, f"Running: {os.path.basename(script_path)}")
-            rc, _, _ = self._run(["bash", script_path], desc="Flash script")
-            self._cleanup(rom_dir)
+            # Xiaomi scripts forward their arguments to every fastboot call
+            args = ["-s", self.serial] if self.serial else []
+            rc, _, _ = self._run(["bash", script_path, *args], desc="Flash script")
             return rc == 0
         else:
             # Manual fastboot flash of all .img files
             self.log.info("No flash script found — flashing images manually via fastboot")
-            return self._flash_images_from_dir(rom_dir, slot=slot)
+            return self._flash_images_from_dir(rom_dir, slot=slot, cleanup=False)
 
-    def _flash_images_from_dir(self, rom_dir: str, slot: str = "all") -> bool:
+    def _flash_images_from_dir(self, rom_dir: str, slot: str = "all",
+                               cleanup: bool = True) -> bool:
         imgs = sorted(Path(rom_dir).rglob("*.img"))
         if not imgs:
             self.log.error("No .img files found in ROM directory!")
@@ -207,19 +456,118 @@ class FlashManager:
         self.log.info(f"Found {len(imgs)} image(s) to flash")
         success = True
         for i, img in enumerate(imgs, 1):
-            partition = img.stem
-            self.log.step(i, len(imgs), f"Flashing {partition}.img")
-            slots_to_flash = ["_a", "_b"] if slot == "all" else [f"_{slot}"]
-            # Try both slots; if single-slot device, just flash without suffix
-            for s in slots_to_flash:
-                ok = self._fastboot("flash", f"{partition}{s}", str(img))
+            self.log.checkpoint()
+            self.log.step(i, len(imgs), f"Flashing {img.name}")
+            if not self._flash_partition_img(img.stem, str(img), slot):
+                success = False
+        if cleanup:
+            self._cleanup(rom_dir)
+        return success
+
+    def _slot_suffixes(self, slot: str = "all") -> list:
+        """Suffixes to flash; [""] when the getvar snapshot says the device is A-only."""
+        fb = self.dev.fb_vars
+        if fb and fb.slot_count < 2:
+            return [""]
+        return ["_a", "_b"] if slot == "all" else [f"_{slot}"]
+
+    def _check_partition(self, partition: str, img: str):
+        """Warn early about mismatches the getvar snapshot can already tell us about."""
+        fb = self.dev.fb_vars
+        if not fb:
+            return
+        if fb.is_logical(partition) and not fb.is_userspace:
+            self.log.warning(f"{partition} is a logical partition — flashing it needs fastbootd "
+                             f"(miflasher device --reboot fastbootd)")
+        size = fb.partition_size(partition)
+        if size and os.path.getsize(img) > size:
+            self.log.warning(f"{os.path.basename(img)} ({self._fmt_size(os.path.getsize(img))}) "
+                             f"is larger than {partition} ({self._fmt_size(size)})")
+
+    def _flash_partition_img(self, partition: str, img: str, slot: str = "all") -> bool:
+        """Flash one image to each requested slot, falling back to no suffix."""
+        self._check_partition(partition, img)
+        for s in self._slot_suffixes(slot):
+            ok = self._fastboot("flash", f"{partition}{s}", img)
+            if not ok and s:
+                ok = self._fastboot("flash", partition, img)
+            if not ok:
+                self.log.warning(f"Could not flash {partition}")
+                return False
+        return True
+
+    def _stream_flash_archive(self, path: str, plan: list, slot: str = "all") -> bool:
+        """
+        Flash the images of a ROM archive while extracting just-in-time, in
+        the order of `plan` (from _stream_plan). A producer thread extracts the
+        next image while the current one is being flashed; each image is
+        deleted as soon as it has been flashed, so at most STREAM_WINDOW
+        images are on disk at any moment.
+        """
+        os.makedirs(TEMP_DIR, exist_ok=True)
+        stage_dir = tempfile.mkdtemp(prefix=Path(path).stem.replace(".tar", "") + ".stream.",
+                                     dir=TEMP_DIR)
+
+        total  = len(plan)
+        ready  = queue.Queue()
+        window = threading.Semaphore(self.STREAM_WINDOW)
+        stop   = threading.Event()
+
+        def producer():
+            try:
+                for i, (partition, name, src, size) in enumerate(
+                        self._iter_archive_images(path, plan)):
+                    window.acquire()
+                    if stop.is_set():
+                        return
+                    # the same image may be flashed to several partitions
+                    dst = os.path.join(stage_dir, f"{i}_{os.path.basename(name)}")
+                    with open(dst, "wb") as f:
+                        shutil.copyfileobj(src, f, self.COPY_BUFSIZE)
+                    ready.put((partition, name, dst))
+            except (OSError, zipfile.BadZipFile, tarfile.TarError) as e:
+                ready.put(e)
+            finally:
+                ready.put(None)
+
+        worker = threading.Thread(target=producer, name="rom-extract", daemon=True)
+        worker.start()
+
+        success = True
+        flashed = 0
+        try:
+            while True:
+                item = ready.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    self.log.error(f"Archive read failed: {item}")
+                    success = False
+                    break
+                partition, name, img = item
+                self.log.checkpoint()
+                flashed += 1
+                self.log.step(flashed, total,
+                              f"Flashing {partition} ← {os.path.basename(name)}")
+                if partition.endswith("_ab"):
+                    ok = self._flash_partition_img(partition[:-3], img, slot)
+                elif partition.endswith(("_a", "_b")):
+                    ok = self._fastboot("flash", partition, img)
+                else:
+                    ok = self._flash_partition_img(partition, img, slot)
+                os.remove(img)
+                window.release()
                 if not ok:
-                    ok = self._fastboot("flash", partition, str(img))
-                    if not ok:
-                        self.log.warning(f"Could not flash {partition}")
-                        success = False
-                        break
-        self._cleanup(rom_dir)
+                    success = False
+        finally:
+            stop.set()
+            window.release()  # unblock the producer if it is waiting for a slot
+            worker.join(timeout=5)
+            self._cleanup(stage_dir)
+
+        if flashed == 0 and success:
+            self.log.error("No .img files found in ROM archive!")
+            return False
         return success
 
     # ── Single image (boot / recovery / vbmeta) ───────────────────────────────
@@ -236,32 +584,61 @@ class FlashManager:
         }
         partition = partition_map.get(target, target)
 
-        if slot == "all":
-            slots = ["_a", "_b"]
-        else:
-            slots = [f"_{slot}"]
+        slots = self._slot_suffixes(slot)
+        self._check_partition(partition, path)
 
         for s in slots:
             self.log.step(slots.index(s) + 1, len(slots), f"Flashing {partition}{s}")
             ok = self._fastboot("flash", f"{partition}{s}", path)
-            if not ok:
+            if not ok and s:
                 # Try without slot suffix (A-only device)
                 self.log.info(f"Retrying without slot suffix...")
                 ok = self._fastboot("flash", partition, path)
-                if not ok:
-                    return False
+            if not ok:
+                return False
 
         return True
 
     # ── Super partition ───────────────────────────────────────────────────────
 
     def _flash_super(self, path: str, **opts) -> bool:
+        """
+        Flash super as a sparse image: zero / constant blocks travel as FILL
+        chunks and every block is still written, so no erase pass is needed.
+        """
         if not self._require_device("fastboot"):
             return False
-        self.log.step(1, 2, "Erasing super partition...")
-        self._fastboot("erase", "super")
-        self.log.step(2, 2, "Flashing super.img...")
-        return self._fastboot("flash", "super", path)
+        if is_network_serial(self.serial):
+            # the built-in client converts and splits on the fly
+            self.log.step(1, 1, "Flashing super.img...")
+            return self._fastboot("flash", "super", path)
+
+        sparse_path = path
+        try:
+            if not SparseImage.is_sparse(path):
+                self.log.step(1, 2, "Converting super.img to sparse...")
+                # one file per call: several devices may be flashing super at once
+                os.makedirs(TEMP_DIR, exist_ok=True)
+                fd, sparse_path = tempfile.mkstemp(prefix="super.", suffix=".sparse.img",
+                                                   dir=TEMP_DIR)
+                os.close(fd)
+                try:
+                    with SparseImage.open(path) as img:
+                        size = img.write(sparse_path)
+                except (SparseError, OSError) as e:
+                    self.log.error(f"Sparse conversion failed: {e}")
+                    return False
+                self.log.info(f"super.img: {self._fmt_size(img.raw_size)} raw → "
+                              f"{self._fmt_size(size)} sparse")
+
+            # -S: let fastboot resparse against the device buffer we already know
+            fb   = self.dev.fb_vars
+            args = ["-S", str(fb.max_download_size)] if fb and fb.max_download_size else []
+            self.log.step(2, 2, "Flashing super.img...")
+            return self._fastboot(*args, "flash", "super", sparse_path)
+        finally:
+            if sparse_path != path and os.path.exists(sparse_path):
+                os.remove(sparse_path)
 
     # ── Payload ───────────────────────────────────────────────────────────────
 
@@ -269,28 +646,30 @@ class FlashManager:
         if not self._require_device("fastboot"):
             return False
         self.log.info("Flashing via payload.bin (OTA package)")
-        # Use payload-dumper-go or python payload_dumper
-        # Try payload-dumper-go first
-        out_dir = os.path.join(TEMP_DIR, "payload_out")
-        os.makedirs(out_dir, exist_ok=True)
-
-        if shutil.which("payload-dumper-go"):
-            self.log.step(1, 2, "Extracting payload with payload-dumper-go...")
-            rc, _, _ = self._run(["payload-dumper-go", "-o", out_dir, path])
-        elif shutil.which("payload_dumper"):
-            self.log.step(1, 2, "Extracting payload with payload_dumper...")
-            rc, _, _ = self._run(["payload_dumper", "--out", out_dir, path])
-        else:
-            self.log.error("payload-dumper-go or payload_dumper not found!")
-            self.log.info("Install: pip install payload-dumper-go --break-system-packages")
-            return False
-
-        if rc != 0:
-            self.log.error("Payload extraction failed!")
-            return False
+        if opts.get("payload_dir"):
+            # Already extracted once for several devices (MultiFlashManager)
+            self.log.info(f"Using extracted images: {opts['payload_dir']}")
+            return self._flash_images_from_dir(opts["payload_dir"], slot=opts.get("slot", "all"),
+                                               cleanup=False)
+        # a directory of its own: other jobs may be extracting payloads too
+        os.makedirs(TEMP_DIR, exist_ok=True)
+        out_dir = tempfile.mkdtemp(prefix="payload_out.", dir=TEMP_DIR)
+        try:
+            partitions = opts.get("partitions")
+            if partitions:
+                self.log.info(f"Partitions: {', '.join(partitions)}")
+
+            self.log.step(1, 2, "Extracting payload...")
+            imgs = PayloadExtractor(self.log).extract(path, out_dir, partitions=partitions)
+            if not imgs:
+                self.log.error("Payload extraction failed!")
+                return False
 
-        self.log.step(2, 2, "Flashing extracted images...")
-        return self._flash_images_from_dir(out_dir, slot=opts.get("slot", "all"))
+            self.log.step(2, 2, "Flashing extracted images...")
+            return self._flash_images_from_dir(out_dir, slot=opts.get("slot", "all"),
+                                               cleanup=False)
+        finally:
+            self._cleanup(out_dir)
 
     # ── Helpers ───────────────────────────────────────────────────────────────
 
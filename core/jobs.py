@@ -0,0 +1,258 @@
+"""
+MiFlasher Job Runner
+Runs long operations — flash, backup, restore — on background threads so the
+GUI stays responsive: one queue per device serial, so a bench of devices works
+in parallel while jobs for the same device run one after another. Every job
+has an id, a status, its latest progress event and its own logger / session
+file whose entries can be read while it runs; an optional `on_event(kind,
+data)` callback also receives every log line, progress tick and status
+change as it happens (the GUI's /api/events feed).
+Cancelling stops a job at its next step boundary (`log.checkpoint()`: between
+partitions, archive members or download chunks); a step already running —
+a fastboot command, both slots of one partition — is left to finish.
+"""
+
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, asdict
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from core.logger import Logger
+from core.session import LOG_DIR
+
+
+class JobCancelled(BaseException):
+    """
+    Raised in a job's thread once cancellation was requested. A BaseException,
+    so the `except Exception` handlers around flashing steps don't swallow it.
+    """
+
+
+@dataclass
+class Job:
+    id:       str
+    kind:     str                       # flash | backup | restore
+    params:   dict
+    status:   str   = "queued"          # queued | running | done | failed | cancelled
+    message:  str   = ""
+    progress: Optional[dict] = None     # latest Progress.event()
+    created:  float = field(default_factory=time.time)
+    started:  float = 0.0
+    finished: float = 0.0
+    log_path: str   = ""
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+class _JobLogger(Logger):
+    """
+    Logger for one job. Confirmations were already given in the dashboard, and
+    checkpoint() in the job's own thread raises JobCancelled once cancelled —
+    never log() or a progress tick, which also run in cleanup code.
+    """
+
+    def __init__(self, job: Job, cancel: threading.Event, on_event=None):
+        super().__init__()
+        self.prefix    = f"[job {job.id}] "
+        self._job      = job
+        self._cancel   = cancel
+        self._on_event = on_event
+        self._thread   = None               # ident of the thread running the job
+        self.subscribe_progress(self._on_progress)
+
+    def checkpoint(self):
+        if self._cancel.is_set() and threading.get_ident() == self._thread:
+            raise JobCancelled()
+
+    def _on_progress(self, ev: dict):
+        self._job.progress = ev
+        if self._on_event:
+            self._on_event("progress", {"job": self._job.id, **ev})
+
+    def _write(self, level, msg) -> int:
+        # publish this entry's own seq: the ring cursor may already include other threads' lines
+        seq = super()._write(level, msg)
+        if self._on_event:
+            self._on_event("log", {"job": self._job.id, "seq": seq,
+                                   "time": datetime.now().isoformat(),
+                                   "level": level, "message": msg})
+        return seq
+
+    def confirm(self, msg, default=False):
+        self.log(f"{msg} → yes (confirmed in the dashboard)")
+        return True
+
+
+# ── Runners ───────────────────────────────────────────────────────────────────
+
+def _run_flash(log, p: dict) -> bool:
+    from core.flash import FlashManager
+    source = p["source"]
+    opts   = {k: p[k] for k in ("slot", "keep_data", "wipe_data", "no_reboot", "stream")
+              if k in p}
+    return FlashManager(log, serial=p.get("serial")).flash(
+        p.get("target", "rom"), source,
+        is_url=source.startswith(("http://", "https://")), **opts)
+
+
+def _run_backup(log, p: dict) -> bool:
+    from core.backup import BackupManager
+    out_dir = p.get("out_dir")
+    return bool(BackupManager(log, serial=p.get("serial")).backup(
+        partitions=p.get("partitions") or None,
+        out_dir=os.path.expanduser(out_dir) if out_dir else None,
+        compress=p.get("compress", False)))
+
+
+def _run_restore(log, p: dict) -> bool:
+    from core.backup import BackupManager
+    return bool(BackupManager(log, serial=p.get("serial")).restore(
+        path=os.path.expanduser(p["path"]), partitions=p.get("partitions") or None))
+
+
+class JobManager:
+
+    RUNNERS: Dict[str, Callable] = {
+        "flash":   _run_flash,
+        "backup":  _run_backup,
+        "restore": _run_restore,
+    }
+    REQUIRED = {"flash": ("source",), "backup": (), "restore": ("path",)}
+    KEEP     = 50     # finished jobs remembered
+
+    def __init__(self, on_event: Optional[Callable[[str, dict], None]] = None):
+        # one single-thread queue per serial ("" = no device attached at submit time)
+        self._pools:  Dict[str, ThreadPoolExecutor] = {}
+        self._jobs:   Dict[str, Job] = {}
+        self._cancel: Dict[str, threading.Event] = {}
+        self._logs:   Dict[str, _JobLogger] = {}
+        self._lock   = threading.Lock()
+        self._ids    = itertools.count(1)
+        self.on_event = on_event     # (kind, data) for every log line, progress tick, status change
+
+    # ── Public API ────────────────────────────────────────────────────────────
+
+    def submit(self, kind: str, **params) -> Job:
+        """Queue a job; raises ValueError for an unknown kind or missing parameter."""
+        if kind not in self.RUNNERS:
+            raise ValueError(f"Unknown job type: {kind}")
+        missing = [k for k in self.REQUIRED[kind] if not params.get(k)]
+        if missing:
+            raise ValueError(f"Missing: {', '.join(missing)}")
+
+        # pin unpinned jobs to the device they would act on, so they share its queue
+        serial = params.get("serial") or self._attached_serial()
+        if serial:
+            params["serial"] = serial
+
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        with self._lock:
+            job = Job(id=str(next(self._ids)), kind=kind, params=params)
+            job.log_path = os.path.join(LOG_DIR, f"session_{stamp}_job{job.id}.jsonl")
+            cancel = threading.Event()
+            log    = _JobLogger(job, cancel, self.on_event)
+            log.set_file(job.log_path)
+            self._jobs[job.id], self._cancel[job.id], self._logs[job.id] = job, cancel, log
+            self._forget_old()
+        self._changed(job)
+        self._queue(serial).submit(self._execute, job, log, cancel)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def jobs(self, serial: Optional[str] = None) -> List[Job]:
+        """Every remembered job (or those for one serial), newest first."""
+        with self._lock:
+            return [j for j in reversed(self._jobs.values())
+                    if serial is None or j.params.get("serial") == serial]
+
+    def entries(self, job_id: str, cursor: int = 0):
+        """(new cursor, log entries as dicts) logged by a job after `cursor`."""
+        log = self._logs.get(job_id)
+        if not log:
+            return cursor, []
+        cursor, rows = log.since(cursor)
+        return cursor, [{"seq": seq, "time": datetime.fromtimestamp(ts).isoformat(),
+                         "level": level, "message": msg} for seq, ts, level, msg in rows]
+
+    def cancel(self, job_id: str) -> bool:
+        """Request cancellation; False when the job is unknown or already over."""
+        job = self._jobs.get(job_id)
+        if not job or job.status not in ("queued", "running"):
+            return False
+        self._cancel[job_id].set()
+        if job.status == "queued":
+            job.status, job.message = "cancelled", "Cancelled before start"
+            self._changed(job)
+        return True
+
+    def shutdown(self):
+        for job in self.jobs():
+            self.cancel(job.id)
+        with self._lock:
+            pools = list(self._pools.values())
+        for pool in pools:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    # ── Internals ─────────────────────────────────────────────────────────────
+
+    @staticmethod
+    def _attached_serial() -> str:
+        """Serial an unpinned job would act on (the first attached device); "" when none."""
+        from core.device import DeviceManager
+        devices = DeviceManager(Logger()).list_devices()
+        return devices[0][0] if devices else ""
+
+    def _queue(self, serial: str) -> ThreadPoolExecutor:
+        with self._lock:
+            if serial not in self._pools:
+                self._pools[serial] = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix=f"job-{serial or 'any'}")
+            return self._pools[serial]
+
+    def _changed(self, job: Job):
+        if self.on_event:
+            try:
+                self.on_event("job", job.to_dict())
+            except Exception:
+                pass
+
+    def _execute(self, job: Job, log: _JobLogger, cancel: threading.Event):
+        if cancel.is_set():
+            job.status, job.message = "cancelled", "Cancelled before start"
+            job.finished = time.time()
+            log.close()
+            return
+        log._thread = threading.get_ident()
+        job.status, job.started = "running", time.time()
+        self._changed(job)
+        try:
+            ok = self.RUNNERS[job.kind](log, job.params)
+            job.status  = "done" if ok else "failed"
+            job.message = f"{job.kind.capitalize()} {'complete' if ok else 'failed'}"
+        except JobCancelled:
+            log._thread = None
+            job.status, job.message = "cancelled", "Cancelled"
+            log.warning("Job cancelled")
+        except Exception as e:
+            log._thread = None
+            job.status, job.message = "failed", f"Unexpected error: {e}"
+            log.error(job.message)
+        finally:
+            log._thread  = None
+            job.finished = time.time()
+            log.close()
+            self._changed(job)
+
+    def _forget_old(self):
+        """Drop the oldest finished jobs beyond KEEP (caller holds the lock)."""
+        done = [j.id for j in self._jobs.values() if j.status in ("done", "failed", "cancelled")]
+        for job_id in done[:max(0, len(done) - self.KEEP)]:
+            for table in (self._jobs, self._cancel, self._logs):
+                table.pop(job_id, None)
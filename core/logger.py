@@ -6,9 +6,272 @@ import sys
 import os
 import time
 import json
+import queue
+import atexit
+import threading
+from collections import deque
 from datetime import datetime
 
 
+LEVELS    = ("debug", "info", "success", "warning", "error", "critical", "step", "header")
+LEVEL_IDS = {name: i for i, name in enumerate(LEVELS)}
+
+
+class LogRing:
+    """
+    Fixed-capacity in-memory log: parallel slot arrays (float timestamp, level
+    id, message) overwritten oldest-first. Every entry gets a sequence number
+    that never resets, so readers keep a cursor and ask only for what's new.
+    """
+
+    def __init__(self, capacity: int = 2000):
+        self.capacity = capacity
+        self._ts      = [0.0] * capacity
+        self._level   = bytearray(capacity)
+        self._msg     = [""] * capacity
+        self._seq     = 0                  # entries ever appended
+        self._lock    = threading.Lock()
+
+    def append(self, ts: float, level: str, msg: str) -> int:
+        """Store one entry; returns its seq."""
+        with self._lock:
+            i = self._seq % self.capacity
+            self._ts[i]    = ts
+            self._level[i] = LEVEL_IDS.get(level, LEVEL_IDS["info"])
+            self._msg[i]   = msg
+            self._seq += 1
+            return self._seq
+
+    @property
+    def cursor(self) -> int:
+        return self._seq
+
+    def __len__(self) -> int:
+        return min(self._seq, self.capacity)
+
+    def since(self, cursor: int = 0, limit: int = 0):
+        """
+        (new cursor, [(seq, ts, level, message), ...]) for entries after `cursor`,
+        oldest first, at most `limit` of them. Entries already overwritten are
+        skipped — a gap in seq tells the reader it fell behind.
+        """
+        with self._lock:
+            end   = self._seq
+            start = max(cursor, end - self.capacity, 0)
+            if limit:
+                end = min(end, start + limit)
+            out = []
+            for s in range(start, end):
+                i = s % self.capacity
+                out.append((s + 1, self._ts[i], LEVELS[self._level[i]], self._msg[i]))
+        return end, out
+
+
+def _entry(ts: float, level: str, msg: str) -> dict:
+    """Session-file / API form of a log entry."""
+    return {"time": datetime.fromtimestamp(ts).isoformat(), "level": level, "message": msg}
+
+
+class _FileWriter:
+    """
+    Appends JSONL entries from a background thread so logging never waits on
+    slow storage (SD cards under Termux). Entries are batched and flushed every
+    FLUSH_SECS or FLUSH_BYTES, and on flush() / close(). When the queue is full,
+    debug entries are dropped (and counted) while everything else waits.
+    Entries put after close() are appended synchronously.
+    """
+
+    QUEUE_MAX   = 10000
+    FLUSH_SECS  = 1.0
+    FLUSH_BYTES = 64 * 1024
+
+    def __init__(self, path: str):
+        self.path     = path
+        self._file    = open(path, "a", encoding="utf-8")
+        self._queue   = queue.Queue(maxsize=self.QUEUE_MAX)
+        self._dropped = 0
+        self._closed  = False
+        self._lock    = threading.Lock()   # orders put() against close()
+        self._thread  = threading.Thread(target=self._loop, name="log-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def put(self, ts: float, level: str, msg: str):
+        item = (ts, level, msg)
+        with self._lock:
+            if self._closed:
+                self._append(item)           # nobody is draining the queue any more
+            elif level == "debug":
+                try:
+                    self._queue.put_nowait(item)
+                except queue.Full:
+                    self._dropped += 1
+            else:
+                self._queue.put(item)
+
+    def flush(self, timeout: float = 5.0):
+        """Block until everything queued so far is on disk."""
+        if self._closed:
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._thread.join(timeout=10)
+        atexit.unregister(self.close)
+
+    def _append(self, item: tuple):
+        try:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(_entry(*item)) + "\n")
+        except OSError:
+            pass
+
+    def _loop(self):
+        pending, size = [], 0
+        deadline = time.monotonic() + self.FLUSH_SECS
+        while True:
+            try:
+                item = self._queue.get(timeout=max(deadline - time.monotonic(), 0.01))
+            except queue.Empty:
+                item = False                        # time-based flush
+            if isinstance(item, tuple):
+                line = json.dumps(_entry(*item)) + "\n"
+                pending.append(line)
+                size += len(line)
+                if size < self.FLUSH_BYTES and time.monotonic() < deadline:
+                    continue
+            if pending or self._dropped:
+                if self._dropped:
+                    pending.append(json.dumps(_entry(
+                        time.time(), "warning",
+                        f"{self._dropped} debug log entries dropped (writer busy)")) + "\n")
+                    self._dropped = 0
+                try:
+                    self._file.write("".join(pending))
+                    self._file.flush()
+                except OSError:
+                    pass                            # never let logging take the flash down
+                pending, size = [], 0
+            deadline = time.monotonic() + self.FLUSH_SECS
+            if isinstance(item, threading.Event):
+                item.set()
+            elif item is None:
+                self._file.close()
+                return
+
+
+def _fmt_size(b):
+    for u in ("B", "KB", "MB", "GB"):
+        if b < 1024: return f"{b:.1f}{u}"
+        b /= 1024
+    return f"{b:.1f}TB"
+
+
+def _fmt_eta(secs):
+    if secs < 60: return f"{int(secs)}s"
+    return f"{int(secs // 60)}m{int(secs % 60):02d}s"
+
+
+class Progress:
+    """
+    One progress bar. update() only counts; the bar is redrawn and a progress
+    event sent at most MAX_RATE times per second, so the cost stays flat however
+    small the chunks are. Speed and ETA come from the last WINDOW seconds.
+    """
+
+    MAX_RATE = 10      # redraws / events per second
+    WINDOW   = 5.0     # seconds of history behind speed and ETA
+
+    def __init__(self, log, desc: str = "Progress", total=None):
+        import shutil
+        self.log    = log
+        self.desc   = desc
+        self.total  = total
+        self.done   = 0
+        self.start  = time.monotonic()
+        self._next  = 0.0                          # earliest time of the next redraw
+        self._window = deque([(self.start, 0)])    # (time, done) samples
+        self._width  = shutil.get_terminal_size((80, 20)).columns
+        self._bar    = min(35, self._width - 40)
+
+    def update(self, n: int = 1):
+        self.done += n
+        now = time.monotonic()
+        if now >= self._next:
+            self._next = now + 1 / self.MAX_RATE
+            self._tick(now)
+
+    def speed(self, now=None) -> float:
+        """Bytes (items) per second over the moving window."""
+        now = now or time.monotonic()
+        t0, d0 = self._window[0]
+        return (self.done - d0) / max(now - t0, 1e-3)
+
+    def event(self, now=None, finished: bool = False) -> dict:
+        now   = now or time.monotonic()
+        speed = self.speed(now)
+        left  = (self.total - self.done) if self.total else None
+        return {
+            "desc":     self.desc,
+            "done":     self.done,
+            "total":    self.total,
+            "fraction": min(self.done / self.total, 1.0) if self.total else None,
+            "speed":    speed,
+            "eta":      left / speed if left is not None and speed > 0 else None,
+            "elapsed":  now - self.start,
+            "finished": finished,
+        }
+
+    def _tick(self, now: float):
+        self._window.append((now, self.done))
+        while len(self._window) > 2 and now - self._window[0][0] > self.WINDOW:
+            self._window.popleft()
+        ev = self.event(now)
+        self._draw(ev)
+        self._emit(ev)
+
+    def _emit(self, ev: dict):
+        for callback in list(self.log._progress_subs):
+            try:
+                callback(ev)
+            except Exception:
+                pass
+
+    def _draw(self, ev: dict):
+        speed = _fmt_size(ev["speed"]) + "/s"
+        if self.total:
+            filled = int(self._bar * ev["fraction"])
+            bar    = "█" * filled + "░" * (self._bar - filled)
+            eta    = _fmt_eta(ev["eta"]) if ev["eta"] is not None else "--"
+            line   = (f"  \033[1;36m{self.desc}\033[0m "
+                      f"\033[1;34m[{bar}]\033[0m "
+                      f"\033[1;32m{ev['fraction'] * 100:5.1f}%\033[0m "
+                      f"\033[2m{_fmt_size(self.done)}/{_fmt_size(self.total)} "
+                      f"@ {speed} ETA {eta}\033[0m")
+        else:
+            spinner = "⠋⠙⠹⠸⠼⠴⠦⠧⠇⠏"[int(ev["elapsed"] * 5) % 10]
+            line    = (f"  \033[1;36m{self.desc}\033[0m "
+                       f"\033[1;34m{spinner}\033[0m "
+                       f"\033[2m{_fmt_size(self.done)} @ {speed}\033[0m")
+        sys.stdout.write("\r" + line[:self._width])
+        sys.stdout.flush()
+
+    def finish(self):
+        now = time.monotonic()
+        ev  = self.event(now, finished=True)
+        ev["speed"] = self.done / max(ev["elapsed"], 1e-3)   # overall average
+        self._emit(ev)
+        print(f"\r  \033[1;32m✅ {self.desc}: {_fmt_size(self.done)} "
+              f"in {ev['elapsed']:.1f}s\033[0m" + " " * 20)
+
+
 class Logger:
     COLORS = {
         "debug":   "\033[2;37m",
@@ -31,35 +294,45 @@ class Logger:
         "header":  "━━",
     }
     RESET = "\033[0m"
+    RING_SIZE = 2000   # entries kept in memory
 
     def __init__(self):
         self.verbose  = False
         self.no_color = False
         self._file    = None
-        self._entries = []  # in-memory log buffer
+        self.prefix   = ""  # e.g. "[serial] " for per-device loggers
+        self._entries = LogRing(self.RING_SIZE)   # recent entries, bounded
+        self._progress_subs = []                 # Progress event callbacks
+
+    @property
+    def file_path(self):
+        """Session file this logger writes to (None when it has none)."""
+        return self._file.path if self._file else None
 
     def set_file(self, path):
         os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
-        self._file = open(path, "a", encoding="utf-8")
+        if self._file:
+            self._file.close()
+        self._file = _FileWriter(path)
 
     def _format(self, level, msg, timestamp=True):
         ts = datetime.now().strftime("%H:%M:%S") if timestamp else ""
         icon = self.ICONS.get(level, "  ")
         if self.no_color:
-            return f"[{ts}] {level.upper():8s} {icon} {msg}"
+            return f"[{ts}] {level.upper():8s} {icon} {self.prefix}{msg}"
         color = self.COLORS.get(level, "")
-        return f"\033[2m[{ts}]\033[0m {color}{level.upper():8s} {icon} {msg}{self.RESET}"
+        return (f"\033[2m[{ts}]\033[0m {color}{level.upper():8s} {icon} "
+                f"{self.prefix}{msg}{self.RESET}")
 
-    def _write(self, level, msg):
-        entry = {
-            "time":    datetime.now().isoformat(),
-            "level":   level,
-            "message": msg,
-        }
-        self._entries.append(entry)
+    def _write(self, level, msg) -> int:
+        """Record one entry (ring + session file); returns its seq."""
+        ts  = time.time()
+        seq = self._entries.append(ts, level, msg)
         if self._file:
-            self._file.write(json.dumps(entry) + "\n")
-            self._file.flush()
+            self._file.put(ts, level, msg)
+            if level in ("error", "critical"):
+                self._file.flush()
+        return seq
 
     def __call__(self, msg, level="info"):
         """Shorthand: log('msg') or log('msg', 'error')"""
@@ -68,9 +341,17 @@ class Logger:
     def log(self, msg, level="info"):
         if level == "debug" and not self.verbose:
             return
-        print(self._format(level, msg), flush=True)
+        # one write per line so concurrent (per-device) loggers don't interleave
+        sys.stdout.write(self._format(level, msg) + "\n")
+        sys.stdout.flush()
         self._write(level, msg)
 
+    def checkpoint(self):
+        """
+        Step boundary where a long operation may safely stop. A no-op here;
+        GUI job loggers raise JobCancelled from it once the job is cancelled.
+        """
+
     def debug(self, msg):   self.log(msg, "debug")
     def info(self, msg):    self.log(msg, "info")
     def success(self, msg): self.log(msg, "success")
@@ -84,6 +365,7 @@ class Logger:
 
     def header(self, msg):
         """Print a section header."""
+        msg = f"{self.prefix}{msg}"
         sep = "─" * (len(msg) + 4)
         print(f"\n\033[1;35m  ┌{sep}┐\033[0m")
         print(f"\033[1;35m  │  {msg}  │\033[0m")
@@ -106,64 +388,23 @@ class Logger:
         """
         Rich progress bar wrapping any iterable.
         Returns a generator that yields items while drawing progress.
+        Byte-like items count their length, anything else counts 1.
         """
-        import shutil
-        term_width = shutil.get_terminal_size((80, 20)).columns
-        bar_width  = min(35, term_width - 40)
-
-        total_size = total or (len(iterable) if hasattr(iterable, "__len__") else None)
-        start_time = time.time()
-        done       = 0
-
-        def fmt_size(b):
-            for u in ("B","KB","MB","GB"):
-                if b < 1024: return f"{b:.1f}{u}"
-                b /= 1024
-            return f"{b:.1f}TB"
-
-        def fmt_speed(bps):
-            return fmt_size(bps) + "/s"
-
-        def fmt_eta(secs):
-            if secs < 60: return f"{int(secs)}s"
-            return f"{int(secs//60)}m{int(secs%60):02d}s"
-
-        def draw(done_bytes):
-            elapsed = max(time.time() - start_time, 0.001)
-            speed   = done_bytes / elapsed
-
-            if total_size:
-                frac    = min(done_bytes / total_size, 1.0)
-                filled  = int(bar_width * frac)
-                bar     = "█" * filled + "░" * (bar_width - filled)
-                pct     = f"{frac*100:5.1f}%"
-                eta_sec = (total_size - done_bytes) / max(speed, 1)
-                eta_str = fmt_eta(eta_sec)
-                size_str= f"{fmt_size(done_bytes)}/{fmt_size(total_size)}"
-                line    = (f"  \033[1;36m{desc}\033[0m "
-                           f"\033[1;34m[{bar}]\033[0m "
-                           f"\033[1;32m{pct}\033[0m "
-                           f"\033[2m{size_str} @ {fmt_speed(speed)} ETA {eta_str}\033[0m")
-            else:
-                spinner = "⠋⠙⠹⠸⠼⠴⠦⠧⠇⠏"[int(elapsed * 5) % 10]
-                line    = (f"  \033[1;36m{desc}\033[0m "
-                           f"\033[1;34m{spinner}\033[0m "
-                           f"\033[2m{fmt_size(done_bytes)} @ {fmt_speed(speed)}\033[0m")
-
-            sys.stdout.write("\r" + line[:term_width])
-            sys.stdout.flush()
-
+        total = total or (len(iterable) if hasattr(iterable, "__len__") else None)
+        bar   = Progress(self, desc, total)
         for item in iterable:
             yield item
-            if isinstance(item, (bytes, bytearray)):
-                done += len(item)
-            else:
-                done += 1
-            draw(done)
+            bar.update(len(item) if isinstance(item, (bytes, bytearray, memoryview)) else 1)
+        bar.finish()
 
-        elapsed = max(time.time() - start_time, 0.001)
-        final_size = fmt_size(done)
-        print(f"\r  \033[1;32m✅ {desc}: {final_size} in {elapsed:.1f}s\033[0m" + " " * 20)
+    def subscribe_progress(self, callback):
+        """Call `callback(event)` with Progress.event() dicts; returns an unsubscribe function."""
+        self._progress_subs.append(callback)
+
+        def unsubscribe():
+            if callback in self._progress_subs:
+                self._progress_subs.remove(callback)
+        return unsubscribe
 
     def table(self, headers, rows, title=None):
         """Print a neat ASCII table."""
@@ -187,7 +428,17 @@ class Logger:
         print()
 
     def get_entries(self):
-        return list(self._entries)
+        """Entries still in the ring, as dicts."""
+        return [_entry(ts, level, msg) for _, ts, level, msg in self._entries.since(0)[1]]
+
+    def since(self, cursor: int = 0, limit: int = 0):
+        """(new cursor, [(seq, ts, level, message)]) logged after `cursor` — see LogRing.since."""
+        return self._entries.since(cursor, limit)
+
+    def flush(self):
+        """Wait until every entry logged so far is in the session file."""
+        if self._file:
+            self._file.flush()
 
     def close(self):
         if self._file:
@@ -0,0 +1,152 @@
+"""
+MiFlasher Multi-Device Flashing
+Runs one FlashManager per serial on a worker pool — for flashing a rack of devices.
+The ROM is downloaded and extracted once; every device flashes from the same files.
+Each device gets its own session log; a pass/fail summary is printed at the end.
+"""
+
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from core.cache import ExtractCache
+from core.device import DeviceManager
+from core.downloader import download_rom, DEFAULT_CONNECTIONS
+from core.flash import FlashManager, TEMP_DIR
+from core.logger import Logger
+from core.payload import PayloadExtractor
+from core.session import LOG_DIR
+
+
+class MultiFlashManager:
+
+    def __init__(self, log):
+        self.log = log
+        self.dev = DeviceManager(log)
+
+    # ── Helpers ───────────────────────────────────────────────────────────────
+
+    def _device_log(self, serial: str, stamp: str) -> Tuple[Logger, str]:
+        """Console logger prefixed with the serial, writing its own session log."""
+        dlog = Logger()
+        dlog.verbose  = self.log.verbose
+        dlog.no_color = self.log.no_color
+        dlog.prefix   = f"[{serial}] "
+        path = os.path.join(LOG_DIR, f"session_{stamp}_{serial}.jsonl")
+        dlog.set_file(path)
+        return dlog, path
+
+    def _fastboot_serials(self) -> List[str]:
+        serials = []
+        for serial, mode in self.dev.list_devices():
+            if mode == "fastboot":
+                serials.append(serial)
+            else:
+                self.log.warning(f"{serial}: in {mode.upper()} mode — skipped "
+                                 f"(miflasher device --reboot bootloader)")
+        return serials
+
+    def _prepare(self, target: str, source: str, is_url: bool, opts: dict) -> Optional[str]:
+        """
+        Do the per-ROM work once, before any device starts: download, then extract
+        ROM archives into the extract cache or payload.bin into a shared directory
+        (recorded in opts["payload_dir"]). Returns the local source path.
+        """
+        if is_url:
+            source = download_rom(source, self.log,
+                                  connections=opts.get("connections", DEFAULT_CONNECTIONS),
+                                  mirrors=opts.get("mirrors"),
+                                  use_cache=not opts.get("no_cache"))
+            if not source:
+                self.log.error("Download failed. Aborting flash.")
+                return None
+        if not os.path.exists(source):
+            self.log.error(f"File not found: {source}")
+            return None
+
+        if target == "rom" and Path(source).suffix.lower() in (".zip", ".gz", ".tgz"):
+            # Devices share one extracted tree, so streaming per device is off
+            opts["stream"] = False
+            cache = ExtractCache(self.log, TEMP_DIR)
+            tree  = cache.lookup(source)
+            if tree:
+                self.log.success("Using cached extraction")
+            else:
+                tree = FlashManager(self.log)._extract_to_cache(source)
+                if not tree:
+                    return None
+            cache.release(tree)   # each device's flash takes its own hold on the tree
+
+        elif target == "payload":
+            os.makedirs(TEMP_DIR, exist_ok=True)
+            out_dir = tempfile.mkdtemp(prefix="payload_multi.", dir=TEMP_DIR)
+            if not PayloadExtractor(self.log).extract(source, out_dir,
+                                                      partitions=opts.get("partitions")):
+                self.log.error("Payload extraction failed!")
+                shutil.rmtree(out_dir, ignore_errors=True)
+                return None
+            opts["payload_dir"] = out_dir
+
+        return source
+
+    # ── Public API ────────────────────────────────────────────────────────────
+
+    def flash_all(self, target: str, source: str, is_url: bool = False,
+                  serials: Optional[List[str]] = None, jobs: Optional[int] = None,
+                  **opts) -> Dict[str, bool]:
+        """
+        Flash `target` to every serial (default: all devices in Fastboot mode),
+        at most `jobs` at a time. Returns {serial: success}.
+        """
+        self.log.header(f"Multi-Device Flash → {target.upper()}")
+        serials = list(dict.fromkeys(serials or self._fastboot_serials()))
+        if not serials:
+            self.log.error("No devices in Fastboot mode!")
+            return {}
+        self.log.info(f"Devices: {len(serials)} ({', '.join(serials)})")
+
+        opts   = dict(opts)
+        source = self._prepare(target, source, is_url, opts)
+        if not source:
+            return {}
+
+        stamp   = datetime.now().strftime("%Y%m%d_%H%M%S")
+        workers = max(1, min(jobs or len(serials), len(serials)))
+        self.log.info(f"Flashing {len(serials)} device(s), {workers} at a time...")
+
+        def job(serial: str) -> Tuple[bool, float, str]:
+            dlog, path = self._device_log(serial, stamp)
+            start = time.time()
+            try:
+                ok = FlashManager(dlog, serial=serial).flash(target, source, **opts)
+            except Exception as e:
+                dlog.error(f"Unexpected error: {e}")
+                ok = False
+            finally:
+                dlog.close()
+            return ok, time.time() - start, path
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="flash") as pool:
+            futures = {s: pool.submit(job, s) for s in serials}
+            results = {s: f.result() for s, f in futures.items()}
+
+        if opts.get("payload_dir"):
+            shutil.rmtree(opts["payload_dir"], ignore_errors=True)
+
+        rows = [
+            (serial, "PASS" if ok else "FAIL", f"{elapsed:.1f}s", path)
+            for serial, (ok, elapsed, path) in results.items()
+        ]
+        self.log.table(["Serial", "Result", "Time", "Log"], rows, title="Flash Summary")
+
+        passed = sum(1 for ok, _, _ in results.values() if ok)
+        if passed == len(results):
+            self.log.success(f"All {passed} device(s) flashed 🎉")
+        else:
+            self.log.error(f"{len(results) - passed} of {len(results)} device(s) FAILED")
+        return {serial: ok for serial, (ok, _, _) in results.items()}
@@ -1,11 +1,28 @@
 """
 MiFlasher Session Manager
+Session logs are JSONL files. SessionStore keeps a binary offset index next to
+each one (session_<id>.idx: line offset, timestamp, level) that is brought up to
+date incrementally, so every line is parsed once, ever — level and time-range
+queries bisect the index and decode only the lines they return. Plain tails
+read backwards from the end of the file.
 """
 import os, json
+import bisect
+import mmap
+import struct
+import tempfile
 from datetime import datetime
+from typing import List, Optional
+
+from core.logger import LEVEL_IDS
 
 LOG_DIR = os.path.expanduser("~/.local/share/miflasher/logs")
 
+IDX_MAGIC  = b"MFIX"
+IDX_HEADER = struct.Struct("<4sIQQ")   # magic, version, .jsonl bytes indexed, record count
+IDX_RECORD = struct.Struct("<QdB")     # line offset, unix time, level id
+IDX_VERSION = 1
+
 
 class Session:
     def __init__(self, log):
@@ -16,58 +33,273 @@ class Session:
         log.set_file(log_path)
 
 
-class SessionLog:
-    def __init__(self, log):
-        self.log = log
+def parse_time(value: str) -> float:
+    """Unix time from an ISO timestamp, a date, or HH:MM[:SS] (today)."""
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        t = datetime.strptime(value, "%H:%M:%S" if value.count(":") == 2 else "%H:%M")
+        return datetime.now().replace(hour=t.hour, minute=t.minute, second=t.second,
+                                      microsecond=0).timestamp()
+
+
+class _Index:
+    """Read-only view of an .idx file's records (mmap'd)."""
+
+    def __init__(self, path: str):
+        self._f   = open(path, "rb")
+        self._map = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+        # the header may already count records appended after the file was mapped
+        self.count = min(IDX_HEADER.unpack_from(self._map, 0)[3],
+                         (len(self._map) - IDX_HEADER.size) // IDX_RECORD.size)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, i: int):
+        """(offset, ts, level id) of record i."""
+        return IDX_RECORD.unpack_from(self._map, IDX_HEADER.size + i * IDX_RECORD.size)
+
+    def ts(self, i: int) -> float:
+        return self[i][1]
+
+    def close(self):
+        self._map.close()
+        self._f.close()
+
+
+class _Times:
+    """Sequence of record timestamps, for bisect."""
+
+    def __init__(self, index: _Index):
+        self.index = index
 
-    def _get_sessions(self):
-        if not os.path.isdir(LOG_DIR):
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, i):
+        return self.index.ts(i)
+
+
+class SessionStore:
+
+    TAIL_BLOCK = 64 * 1024
+
+    def __init__(self, log_dir: str = LOG_DIR, exclude: Optional[str] = None):
+        self.log_dir = log_dir
+        self.exclude = exclude and os.path.abspath(exclude)   # e.g. this process's own session
+
+    # ── Sessions ──────────────────────────────────────────────────────────────
+
+    def sessions(self) -> List[str]:
+        """Session ids, newest first."""
+        if not os.path.isdir(self.log_dir):
             return []
         return sorted([
-            f for f in os.listdir(LOG_DIR)
+            f[len("session_"):-len(".jsonl")] for f in os.listdir(self.log_dir)
             if f.startswith("session_") and f.endswith(".jsonl")
+            and os.path.abspath(os.path.join(self.log_dir, f)) != self.exclude
         ], reverse=True)
 
+    def latest(self) -> Optional[str]:
+        """Newest session that has any entries."""
+        for sid in self.sessions():
+            if os.path.getsize(self.path(sid)):
+                return sid
+        return None
+
+    def path(self, session_id: str) -> str:
+        return os.path.join(self.log_dir, f"session_{session_id}.jsonl")
+
+    # ── Index ─────────────────────────────────────────────────────────────────
+
+    def _sync_index(self, session_id: str) -> str:
+        """
+        Index any lines appended since the last call; returns the .idx path.
+        New records are appended in place; a rebuild is written to a temporary
+        file and renamed over the index, because readers in other processes
+        may have the old one mmap'd and must never see it shrink.
+        """
+        path     = self.path(session_id)
+        idx_path = path[:-len(".jsonl")] + ".idx"
+        size     = os.path.getsize(path)
+        while True:
+            fd = os.open(idx_path, os.O_RDWR | os.O_CREAT, 0o644)
+            with os.fdopen(fd, "r+b") as idx:
+                try:
+                    import fcntl
+                    fcntl.flock(idx.fileno(), fcntl.LOCK_EX)   # writers in other processes
+                except (ImportError, OSError):
+                    pass
+                try:
+                    if os.stat(idx_path).st_ino != os.fstat(idx.fileno()).st_ino:
+                        continue                         # replaced while we waited for the lock
+                except FileNotFoundError:
+                    continue
+                head = idx.read(IDX_HEADER.size)
+                magic = version = indexed = count = 0
+                if len(head) == IDX_HEADER.size:
+                    magic, version, indexed, count = IDX_HEADER.unpack(head)
+                if magic != IDX_MAGIC or version != IDX_VERSION or indexed > size:
+                    indexed = count = 0                  # missing, foreign or log truncated
+                elif indexed == size:
+                    return idx_path
+
+                records, pos = self._index_lines(path, indexed)
+                header = IDX_HEADER.pack(IDX_MAGIC, IDX_VERSION, pos, count + len(records))
+                if count == 0:
+                    self._replace_index(idx_path, header + b"".join(records))
+                else:
+                    # records past the header's count (a crash between the two
+                    # writes) are simply overwritten; readers go by the count
+                    idx.seek(IDX_HEADER.size + count * IDX_RECORD.size)
+                    idx.write(b"".join(records))
+                    idx.seek(0)
+                    idx.write(header)
+            return idx_path
+
+    @staticmethod
+    def _index_lines(path: str, start: int) -> tuple:
+        """(packed records, end offset) for the complete lines of `path` from `start`."""
+        records, pos = [], start
+        with open(path, "rb") as f:
+            f.seek(start)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break                                # still being written
+                try:
+                    entry = json.loads(line)
+                    ts    = datetime.fromisoformat(entry["time"]).timestamp()
+                    records.append(IDX_RECORD.pack(
+                        pos, ts, LEVEL_IDS.get(entry.get("level"), LEVEL_IDS["info"])))
+                except (ValueError, KeyError, TypeError):
+                    pass                                 # not an entry: skip, but move on
+                pos += len(line)
+        return records, pos
+
+    @staticmethod
+    def _replace_index(idx_path: str, data: bytes):
+        fd, tmp = tempfile.mkstemp(prefix=os.path.basename(idx_path) + ".",
+                                   dir=os.path.dirname(idx_path))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, idx_path)
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+    # ── Queries ───────────────────────────────────────────────────────────────
+
+    def tail(self, session_id: str, n: int = 50) -> List[dict]:
+        """Last n entries (all when n is 0), reading backwards from the end of the file."""
+        with open(self.path(session_id), "rb") as f:
+            pos = f.seek(0, os.SEEK_END)
+            buf = b""
+            while pos > 0 and (not n or buf.count(b"\n") <= n):
+                step = min(self.TAIL_BLOCK, pos)
+                pos -= step
+                f.seek(pos)
+                buf = f.read(step) + buf
+        lines = buf.splitlines()
+        if pos > 0:
+            lines = lines[1:]                            # first line may be cut
+        return self._decode(lines[-n:] if n else lines)
+
+    def query(self, session_id: str, levels=None, since: Optional[float] = None,
+              until: Optional[float] = None, limit: int = 0) -> List[dict]:
+        """
+        Entries of one session, oldest first, filtered by level names and a
+        [since, until] unix-time range; `limit` keeps only the newest matches.
+        """
+        index = _Index(self._sync_index(session_id))
+        try:
+            times = _Times(index)
+            lo = bisect.bisect_left(times, since) if since is not None else 0
+            hi = bisect.bisect_right(times, until) if until is not None else len(index)
+            wanted = {LEVEL_IDS[l] for l in levels if l in LEVEL_IDS} if levels else None
+            picked = []
+            for i in range(hi - 1, lo - 1, -1):          # newest first, so limit stops early
+                offset, _, level = index[i]
+                if wanted is None or level in wanted:
+                    picked.append(offset)
+                    if limit and len(picked) == limit:
+                        break
+        finally:
+            index.close()
+
+        lines = []
+        with open(self.path(session_id), "rb") as f:
+            for offset in reversed(picked):
+                f.seek(offset)
+                lines.append(f.readline())
+        return self._decode(lines)
+
+    @staticmethod
+    def _decode(lines) -> List[dict]:
+        entries = []
+        for line in lines:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                pass
+        return entries
+
+
+class SessionLog:
+    def __init__(self, log):
+        self.log   = log
+        # this process's own (just started) session is never the one to show
+        self.store = SessionStore(exclude=log.file_path)
+
     def list_sessions(self):
-        sessions = self._get_sessions()
+        sessions = self.store.sessions()
         if not sessions:
             self.log.info("No session logs found.")
             return
         rows = []
-        for s in sessions:
-            path = os.path.join(LOG_DIR, s)
+        for sid in sessions:
+            path = self.store.path(sid)
             size = os.path.getsize(path)
-            sid  = s.replace("session_","").replace(".jsonl","")
             rows.append([sid, f"{size} B", path])
         self.log.table(["Session ID","Size","Path"], rows, title="Session Logs")
 
-    def tail(self, n: int = 50):
-        sessions = self._get_sessions()
-        if not sessions:
-            self.log.info("No session logs found.")
-            return
-        path = os.path.join(LOG_DIR, sessions[0])
-        self.log.header(f"Log: {sessions[0]}")
-        lines = []
-        with open(path) as f:
-            for line in f:
-                try:
-                    entry = json.loads(line)
-                    lines.append(entry)
-                except Exception:
-                    pass
-        for entry in lines[-n:]:
+    def _show(self, entries: List[dict]):
+        for entry in entries:
             level = entry.get("level","info")
             msg   = entry.get("message","")
             ts    = entry.get("time","")[:19]
             self.log.log(f"[{ts}] {msg}", level)
 
-    def show_session(self, session_id: str):
-        path = os.path.join(LOG_DIR, f"session_{session_id}.jsonl")
-        if not os.path.exists(path):
+    def tail(self, n: int = 50, session_id: Optional[str] = None, levels=None,
+             since: Optional[str] = None, until: Optional[str] = None):
+        """Last n entries of a session (default: the newest), optionally filtered."""
+        session_id = session_id or self.store.latest()
+        if not session_id:
+            self.log.info("No session logs found.")
+            return
+        if not os.path.exists(self.store.path(session_id)):
             self.log.error(f"Session not found: {session_id}")
             return
-        self.tail(9999)
+        try:
+            t_since = parse_time(since) if since else None
+            t_until = parse_time(until) if until else None
+        except ValueError:
+            self.log.error("Bad --since / --until: use an ISO timestamp (2024-05-01T14:30:00), "
+                           "a date (2024-05-01) or HH:MM[:SS] for today")
+            return
+        self.log.header(f"Log: session_{session_id}.jsonl")
+        if levels or since or until:
+            entries = self.store.query(session_id, levels=levels, since=t_since, until=t_until,
+                                       limit=n)
+        else:
+            entries = self.store.tail(session_id, n)
+        self._show(entries)
+
+    def show_session(self, session_id: str, levels=None,
+                     since: Optional[str] = None, until: Optional[str] = None):
+        """Every entry of one session, optionally filtered."""
+        self.tail(0, session_id, levels, since, until)
 
     def clear(self):
         if self.log.confirm("Clear ALL session logs?", default=False):
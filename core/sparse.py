@@ -0,0 +1,289 @@
+"""
+MiFlasher Sparse Images
+Android sparse image format (libsparse v1.0): read sparse images, convert raw
+images to sparse — FILL chunks for zero / constant blocks, DONT_CARE for file
+holes — and split them into pieces that fit a device's max-download-size.
+Everything streams from an mmap of the source; RAW data is never copied.
+"""
+
+import errno
+import mmap
+import os
+import struct
+from dataclasses import dataclass, replace
+from typing import Iterator, List, Tuple
+
+
+SPARSE_MAGIC = 0xED26FF3A
+# magic, major, minor, hdr size, chunk hdr size, block size, blocks, chunks, crc
+FILE_HDR     = struct.Struct("<IHHHHIIII")
+CHUNK_HDR    = struct.Struct("<HHII")        # type, reserved, blocks, total bytes incl. header
+BLOCK_SIZE   = 4096
+
+CHUNK_RAW       = 0xCAC1
+CHUNK_FILL      = 0xCAC2
+CHUNK_DONT_CARE = 0xCAC3
+CHUNK_CRC32     = 0xCAC4
+
+
+class SparseError(Exception):
+    """Malformed sparse image, or an image that cannot be split as requested."""
+
+
+@dataclass
+class Chunk:
+    type:   int
+    start:  int           # first output block
+    blocks: int
+    offset: int   = 0     # RAW: where the data lives in the source file
+    fill:   bytes = b""   # FILL: 4-byte pattern
+
+    def wire_size(self, block_size: int) -> int:
+        if self.type == CHUNK_RAW:
+            return CHUNK_HDR.size + self.blocks * block_size
+        if self.type == CHUNK_FILL:
+            return CHUNK_HDR.size + 4
+        return CHUNK_HDR.size
+
+
+def _data_extents(fd: int, size: int) -> List[Tuple[int, int]]:
+    """
+    (start, end) ranges holding data; holes in between read as zeros.
+    The whole file when SEEK_DATA / SEEK_HOLE are unsupported.
+    """
+    if not hasattr(os, "SEEK_DATA"):
+        return [(0, size)]
+    extents, pos = [], 0
+    while pos < size:
+        try:
+            start = os.lseek(fd, pos, os.SEEK_DATA)
+        except OSError as e:
+            if e.errno == errno.ENXIO:       # only a hole remains
+                break
+            return [(0, size)]               # filesystem can't report holes
+        end = os.lseek(fd, start, os.SEEK_HOLE)
+        extents.append((start, min(end, size)))
+        pos = end
+    return extents
+
+
+class SparseImage:
+    """
+    A sparse view of an image file. Use as a context manager: the source is
+    mmap'd while open and RAW chunks are served as slices of that map.
+    """
+
+    SCAN_SIZE = 1024 * 1024   # bytes read per pass while converting a raw image
+
+    def __init__(self, path: str, block_size: int, total_blocks: int, chunks: List[Chunk]):
+        self.path         = path
+        self.block_size   = block_size
+        self.total_blocks = total_blocks
+        self.chunks       = chunks
+        self._file = self._map = None
+
+    # ── Construction ──────────────────────────────────────────────────────────
+
+    @staticmethod
+    def is_sparse(path: str) -> bool:
+        with open(path, "rb") as f:
+            head = f.read(4)
+        return len(head) == 4 and struct.unpack("<I", head)[0] == SPARSE_MAGIC
+
+    @classmethod
+    def open(cls, path: str, block_size: int = BLOCK_SIZE) -> "SparseImage":
+        """Parse a sparse image, or scan a raw one into chunks."""
+        return cls.parse(path) if cls.is_sparse(path) else cls.from_raw(path, block_size)
+
+    @classmethod
+    def parse(cls, path: str) -> "SparseImage":
+        with open(path, "rb") as f:
+            hdr = f.read(FILE_HDR.size)
+            if len(hdr) < FILE_HDR.size:
+                raise SparseError("Truncated sparse header")
+            magic, major, _, hdr_sz, chunk_hdr_sz, bs, total_blocks, n_chunks, _ = \
+                FILE_HDR.unpack(hdr)
+            if magic != SPARSE_MAGIC or major != 1:
+                raise SparseError("Not a v1 sparse image")
+            f.seek(hdr_sz)
+
+            chunks, block = [], 0
+            for _ in range(n_chunks):
+                raw = f.read(CHUNK_HDR.size)
+                if len(raw) < CHUNK_HDR.size:
+                    raise SparseError("Truncated chunk header")
+                ctype, _, blocks, total = CHUNK_HDR.unpack(raw)
+                f.seek(chunk_hdr_sz - CHUNK_HDR.size, 1)
+                data_len = total - chunk_hdr_sz
+                if ctype == CHUNK_RAW:
+                    chunks.append(Chunk(CHUNK_RAW, block, blocks, offset=f.tell()))
+                    f.seek(data_len, 1)
+                elif ctype == CHUNK_FILL:
+                    chunks.append(Chunk(CHUNK_FILL, block, blocks, fill=f.read(4)))
+                elif ctype == CHUNK_DONT_CARE:
+                    chunks.append(Chunk(CHUNK_DONT_CARE, block, blocks))
+                elif ctype == CHUNK_CRC32:
+                    f.seek(data_len, 1)
+                    continue
+                else:
+                    raise SparseError(f"Unknown chunk type 0x{ctype:04x}")
+                block += blocks
+        return cls(path, bs, total_blocks, chunks)
+
+    @classmethod
+    def from_raw(cls, path: str, block_size: int = BLOCK_SIZE) -> "SparseImage":
+        """Scan a raw image: holes → DONT_CARE, uniform blocks → FILL, the rest → RAW."""
+        size = os.path.getsize(path)
+        if size == 0 or size % block_size:
+            raise SparseError(f"Image size {size} is not a multiple of {block_size}")
+        bs     = block_size
+        chunks: List[Chunk] = []
+
+        def add(ctype: int, start: int, blocks: int, offset: int = 0, fill: bytes = b""):
+            last = chunks[-1] if chunks else None
+            if (last and last.type == ctype and last.fill == fill
+                    and last.start + last.blocks == start
+                    and (ctype != CHUNK_RAW or last.offset + last.blocks * bs == offset)):
+                last.blocks += blocks
+            else:
+                chunks.append(Chunk(ctype, start, blocks, offset, fill))
+
+        buf  = bytearray(cls.SCAN_SIZE - cls.SCAN_SIZE % bs or bs)
+        zero = bytes(len(buf))
+        pos  = 0
+        with open(path, "rb") as f:
+            for start, end in _data_extents(f.fileno(), size):
+                start = max(pos, start - start % bs)
+                end   = min(size, end + (-end % bs))
+                if start > pos:
+                    add(CHUNK_DONT_CARE, pos // bs, (start - pos) // bs)
+                f.seek(start)
+                pos = start
+                while pos < end:
+                    with memoryview(buf)[:min(len(buf), end - pos)] as view:
+                        n = f.readinto(view)
+                        if n <= 0:
+                            raise SparseError(f"Unexpected end of {path}")
+                        if view[:n] == zero[:n]:
+                            add(CHUNK_FILL, pos // bs, n // bs, fill=b"\0\0\0\0")
+                        else:
+                            for i in range(0, n, bs):
+                                blk  = view[i:i + bs]
+                                word = bytes(blk[:4])
+                                if blk == word * (bs // 4):
+                                    add(CHUNK_FILL, (pos + i) // bs, 1, fill=word)
+                                else:
+                                    add(CHUNK_RAW, (pos + i) // bs, 1, offset=pos + i)
+                                blk.release()
+                    pos += n
+        if pos < size:
+            add(CHUNK_DONT_CARE, pos // bs, (size - pos) // bs)
+        return cls(path, bs, size // bs, chunks)
+
+    # ── Sizes & splitting ─────────────────────────────────────────────────────
+
+    @property
+    def raw_size(self) -> int:
+        return self.total_blocks * self.block_size
+
+    def sparse_size(self) -> int:
+        """Bytes of the image written as one sparse file."""
+        return FILE_HDR.size + sum(c.wire_size(self.block_size) for c in self.chunks)
+
+    def split(self, max_bytes: int = 0) -> List[List[Chunk]]:
+        """
+        Group the data chunks into pieces whose sparse files fit in max_bytes
+        (0 = one piece). Each piece later covers the whole image, with
+        DONT_CARE around its own chunks; oversized RAW chunks are cut.
+        """
+        bs       = self.block_size
+        data     = [c for c in self.chunks if c.type != CHUNK_DONT_CARE]
+        if not max_bytes:
+            return [data]
+        fixed    = FILE_HDR.size + CHUNK_HDR.size          # header + trailing DONT_CARE
+        pieces   = []
+        cur, used = [], fixed
+        for chunk in data:
+            while chunk:
+                need = CHUNK_HDR.size + chunk.wire_size(bs)  # leading DONT_CARE + chunk
+                if used + need <= max_bytes:
+                    cur.append(chunk)
+                    used += need
+                    break
+                if chunk.type == CHUNK_RAW:
+                    fit = (max_bytes - used - 2 * CHUNK_HDR.size) // bs
+                    if fit > 0:
+                        cur.append(replace(chunk, blocks=fit))
+                        chunk = replace(chunk, start=chunk.start + fit, blocks=chunk.blocks - fit,
+                                        offset=chunk.offset + fit * bs)
+                if not cur:
+                    raise SparseError(f"max-download-size {max_bytes} is too small to split into")
+                pieces.append(cur)
+                cur, used = [], fixed
+        if cur or not pieces:
+            pieces.append(cur)
+        return pieces
+
+    # ── Output ────────────────────────────────────────────────────────────────
+
+    def __enter__(self) -> "SparseImage":
+        self._file = open(self.path, "rb")
+        self._map  = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self
+
+    def __exit__(self, *exc):
+        self._map.close()
+        self._file.close()
+        self._map = self._file = None
+
+    def piece(self, chunks: List[Chunk]) -> Tuple[int, Iterator]:
+        """
+        (size, buffers) for one sparse file holding `chunks`. Buffers are headers
+        and memoryview slices of the mmap'd source, each released once consumed.
+        """
+        if self._map is None:
+            raise SparseError("SparseImage must be opened with `with` first")
+        bs   = self.block_size
+        size = FILE_HDR.size
+        count, block = 0, 0
+        for c in chunks:
+            if c.start > block:
+                size += CHUNK_HDR.size
+                count += 1
+            size  += c.wire_size(bs)
+            count += 1
+            block  = c.start + c.blocks
+        if block < self.total_blocks:
+            size  += CHUNK_HDR.size
+            count += 1
+
+        def buffers():
+            yield FILE_HDR.pack(SPARSE_MAGIC, 1, 0, FILE_HDR.size, CHUNK_HDR.size,
+                                bs, self.total_blocks, count, 0)
+            block = 0
+            for c in chunks:
+                if c.start > block:
+                    yield CHUNK_HDR.pack(CHUNK_DONT_CARE, 0, c.start - block, CHUNK_HDR.size)
+                yield CHUNK_HDR.pack(c.type, 0, c.blocks, c.wire_size(bs))
+                if c.type == CHUNK_RAW:
+                    with memoryview(self._map)[c.offset:c.offset + c.blocks * bs] as data:
+                        yield data
+                elif c.type == CHUNK_FILL:
+                    yield c.fill
+                block = c.start + c.blocks
+            if block < self.total_blocks:
+                yield CHUNK_HDR.pack(CHUNK_DONT_CARE, 0, self.total_blocks - block,
+                                     CHUNK_HDR.size)
+
+        return size, buffers()
+
+    def write(self, dst: str) -> int:
+        """Write the whole image as a single sparse file; returns its size."""
+        size, buffers = self.piece(self.split()[0])
+        with open(dst, "wb") as out:
+            try:
+                for buf in buffers:
+                    out.write(buf)
+            finally:
+                buffers.close()
+        return size
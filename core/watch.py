@@ -0,0 +1,230 @@
+"""
+MiFlasher Device Watch
+Event-driven device tracking: the adb server pushes every device-list change
+over host:track-devices, and Fastboot devices are enumerated cheaply — USB
+interfaces in sysfs, or `fastboot devices` where sysfs isn't readable (polled
+with back-off) — so no getprop / dumpsys / getvar runs per tick. Subscribers (CLI `device --watch`,
+the GUI) receive connect / disconnect / mode-change events.
+"""
+
+import os
+import socket
+import subprocess
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+from core.adb import AdbClient, AdbError, adb_mode
+
+
+USB_SYSFS      = "/sys/bus/usb/devices"
+FASTBOOT_IFACE = ("ff", "42", "03")   # vendor class / fastboot subclass / protocol
+
+
+@dataclass
+class DeviceEvent:
+    kind:     str                  # connected | disconnected | mode_changed
+    serial:   str
+    mode:     str                  # current mode ("" once disconnected)
+    previous: str   = ""           # mode before the event
+    time:     float = field(default_factory=time.time)
+    seq:      int   = 0
+
+
+def _read(path: str) -> str:
+    with open(path) as f:
+        return f.read().strip()
+
+
+def fastboot_usb_serials() -> Optional[List[str]]:
+    """Serials of USB devices exposing a fastboot interface; None when sysfs can't be read."""
+    try:
+        entries = os.listdir(USB_SYSFS)
+    except OSError:
+        return None
+    serials = []
+    for name in entries:
+        if ":" not in name:           # interfaces look like 1-1:1.0
+            continue
+        iface = os.path.join(USB_SYSFS, name)
+        try:
+            cls = tuple(_read(os.path.join(iface, f)) for f in
+                        ("bInterfaceClass", "bInterfaceSubClass", "bInterfaceProtocol"))
+            if cls == FASTBOOT_IFACE:
+                serials.append(_read(os.path.join(USB_SYSFS, name.split(":")[0], "serial")))
+        except OSError:
+            continue
+    return serials
+
+
+def fastboot_serials() -> List[str]:
+    """Attached Fastboot devices: sysfs when readable, else `fastboot devices`."""
+    serials = fastboot_usb_serials()
+    if serials is not None:
+        return serials
+    return _fastboot_cli_serials()
+
+
+def _fastboot_cli_serials() -> List[str]:
+    try:
+        r = subprocess.run(["fastboot", "devices"], capture_output=True, text=True, timeout=8)
+    except (OSError, subprocess.TimeoutExpired):
+        return []
+    return [line.split()[0] for line in r.stdout.splitlines() if line.split()]
+
+
+class DeviceWatcher:
+
+    FASTBOOT_INTERVAL = 0.5    # seconds between sysfs scans
+    SPAWN_INTERVAL    = 2.0    # first wait between `fastboot devices` runs without sysfs,
+    SPAWN_BACKOFF_MAX = 15.0   # doubling up to this while nothing changes
+    RETRY_INTERVAL    = 2.0    # wait before reconnecting to the adb server
+    HISTORY           = 200    # events kept for since()
+
+    def __init__(self, log, fastboot_interval: Optional[float] = None):
+        self.log = log
+        self.fastboot_interval = fastboot_interval or self.FASTBOOT_INTERVAL
+        self._adb:      Dict[str, str] = {}
+        self._fastboot: Dict[str, str] = {}
+        self._devices:  Dict[str, str] = {}
+        self._known:    Dict[str, str] = {}   # last mode of every serial seen
+        self._subs:     List[Callable[[DeviceEvent], None]] = []
+        self._events    = deque(maxlen=self.HISTORY)
+        self._seq       = 0
+        self._lock      = threading.Lock()
+        self._stop      = threading.Event()
+        self._wake      = threading.Event()   # adb changes cut the fastboot back-off short
+        self._threads:  List[threading.Thread] = []
+        self._adb_sock: Optional[socket.socket] = None
+
+    # ── Subscribers ───────────────────────────────────────────────────────────
+
+    def subscribe(self, callback: Callable[[DeviceEvent], None]) -> Callable[[], None]:
+        """Call `callback(event)` on every change; returns an unsubscribe function."""
+        with self._lock:
+            self._subs.append(callback)
+
+        def unsubscribe():
+            with self._lock:
+                if callback in self._subs:
+                    self._subs.remove(callback)
+        return unsubscribe
+
+    def devices(self) -> Dict[str, str]:
+        """Current {serial: mode}."""
+        with self._lock:
+            return dict(self._devices)
+
+    def since(self, seq: int) -> Tuple[int, List[DeviceEvent]]:
+        """(latest seq, events after `seq`) — for pollers that can't hold a callback."""
+        with self._lock:
+            return self._seq, [e for e in self._events if e.seq > seq]
+
+    # ── Lifecycle ─────────────────────────────────────────────────────────────
+
+    def start(self) -> "DeviceWatcher":
+        self._stop.clear()
+        for target in (self._adb_loop, self._fastboot_loop):
+            t = threading.Thread(target=target, name=f"watch{target.__name__}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        sock = self._adb_sock
+        if sock:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)   # wakes the blocked track-devices read
+            except OSError:
+                pass
+        for t in self._threads:
+            t.join(timeout=5)
+        self._threads = []
+
+    def __enter__(self) -> "DeviceWatcher":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # ── Sources ───────────────────────────────────────────────────────────────
+
+    def _adb_loop(self):
+        def opened(sock):
+            self._adb_sock = sock
+
+        while not self._stop.is_set():
+            try:
+                for devices in AdbClient.shared().track_devices(on_open=opened):
+                    self._update("adb", {s: m for s, st in devices if (m := adb_mode(st))})
+            except (AdbError, OSError) as e:
+                if not self._stop.is_set():
+                    self.log.debug(f"adb track-devices: {e} — retrying")
+            self._adb_sock = None
+            self._update("adb", {})
+            self._stop.wait(self.RETRY_INTERVAL)
+
+    def _fastboot_loop(self):
+        spawn_wait = self.SPAWN_INTERVAL
+        while not self._stop.is_set():
+            serials = fastboot_usb_serials()
+            if serials is not None:
+                wait = self.fastboot_interval
+            else:
+                # every poll spawns a process: back off while nothing changes
+                serials = _fastboot_cli_serials()
+                if set(serials) != set(self._fastboot):
+                    spawn_wait = self.SPAWN_INTERVAL
+                wait       = spawn_wait
+                spawn_wait = min(spawn_wait * 2, self.SPAWN_BACKOFF_MAX)
+            self._update("fastboot", {s: "fastboot" for s in serials})
+            if self._wake.wait(wait):
+                # a device just left or joined adb — it may be rebooting into fastboot
+                self._wake.clear()
+                spawn_wait = self.SPAWN_INTERVAL
+
+    # ── Diffing ───────────────────────────────────────────────────────────────
+
+    def _update(self, source: str, found: Dict[str, str]):
+        """Replace one source's view, diff the merged device list, notify subscribers."""
+        with self._lock:
+            if source == "adb":
+                self._adb = found
+            else:
+                self._fastboot = found
+            current = {**self._adb, **self._fastboot}
+
+            events = []
+            for serial, mode in current.items():
+                old = self._devices.get(serial)
+                if old is None:
+                    # back in another mode after a reboot → a mode change, not a new device
+                    prev = self._known.get(serial, "")
+                    kind = "mode_changed" if prev and prev != mode else "connected"
+                    events.append(DeviceEvent(kind, serial, mode, prev))
+                elif old != mode:
+                    events.append(DeviceEvent("mode_changed", serial, mode, old))
+            for serial, old in self._devices.items():
+                if serial not in current:
+                    events.append(DeviceEvent("disconnected", serial, "", old))
+
+            self._devices = current
+            self._known.update(current)
+            for ev in events:
+                self._seq += 1
+                ev.seq = self._seq
+                self._events.append(ev)
+            subs = list(self._subs)
+
+        if source == "adb" and events:
+            self._wake.set()
+        for ev in events:
+            for callback in subs:
+                try:
+                    callback(ev)
+                except Exception as e:
+                    self.log.debug(f"watch subscriber failed: {e}")
@@ -3,6 +3,9 @@ MiFlasher Wipe Manager
 """
 import subprocess
 
+from core.adb import AdbClient, AdbError
+from core.device import DeviceManager
+
 
 class WipeManager:
     def __init__(self, log):
@@ -10,6 +13,12 @@ class WipeManager:
 
     def _run(self, cmd):
         import subprocess
+        if cmd[:2] == ["adb", "shell"]:
+            try:
+                rc, _ = AdbClient.shared().shell(None, " ".join(cmd[2:]), timeout=60)
+                return rc
+            except (AdbError, OSError):
+                return 1
         r = subprocess.run(cmd, capture_output=True, text=True, timeout=60)
         return r.returncode
 
@@ -26,6 +35,15 @@ class WipeManager:
             self.log.warning("No wipe targets specified. Use --data, --cache, --dalvik, or --all")
             return
 
+        # Most current devices have no cache partition — skip instead of failing
+        dm = DeviceManager(self.log)
+        fb = dm.fb_vars if cache and dm.detect() else None
+        if fb and fb.partition_sizes and not fb.has_partition("cache"):
+            self.log.info("No cache partition on this device — skipping cache")
+            targets = [t for t in targets if t[0] != "cache"]
+            if not targets:
+                return
+
         self.log.warning(f"About to wipe: {', '.join(t[0] for t in targets)}")
         if not force:
             if not self.log.confirm("This is IRREVERSIBLE. Continue?", default=False):
@@ -1,18 +1,29 @@
 """
 MiFlasher Web GUI
 A full single-file web dashboard served via Python's built-in HTTP server.
+Requests are handled on their own threads; flash / backup / restore run as
+background jobs (core/jobs.py) whose log lines, progress and status reach the
+page — with device changes — over one Server-Sent Events stream (/api/events).
 """
 
+import gzip
+import hashlib
 import json
 import os
 import sys
 import threading
 import time
 import subprocess
-from http.server import BaseHTTPRequestHandler, HTTPServer
-from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, unquote
 import webbrowser
 
+try:
+    import brotli
+    HAS_BROTLI = True
+except ImportError:
+    HAS_BROTLI = False
+
 
 # ─── HTML / CSS / JS ─────────────────────────────────────────────────────────
 
@@ -141,6 +152,10 @@ HTML = """<!DOCTYPE html>
   <div class="logo">⚡ MiFlasher</div>
   <div class="version">v2.0</div>
   <div style="margin-left:auto;display:flex;align-items:center;gap:8px">
+    <select id="deviceSelect" onchange="selectDevice(this.value)"
+            style="width:auto;margin-right:8px">
+      <option value="">First device</option>
+    </select>
     <div class="status-dot" id="statusDot"></div>
     <div class="status-label" id="statusLabel">Scanning...</div>
   </div>
@@ -241,6 +256,8 @@ HTML = """<!DOCTYPE html>
         </div>
         <div style="display:flex;gap:10px;margin-top:4px">
           <button class="btn btn-primary" onclick="startFlash()">⚡ Start Flash</button>
+          <button class="btn btn-danger" id="flashCancel" onclick="cancelJob('flashConsole')"
+                  disabled>✕ Cancel</button>
           <button class="btn btn-ghost" onclick="clearConsole('flashConsole')">Clear Log</button>
         </div>
         <div class="progress-wrap" id="flashProgressWrap" style="display:none">
@@ -271,7 +288,11 @@ HTML = """<!DOCTYPE html>
           <label>Partitions (comma separated, or leave blank for all)</label>
           <input id="backupParts" placeholder="boot,recovery,vbmeta" />
         </div>
-        <button class="btn btn-primary" onclick="startBackup()">💾 Start Backup</button>
+        <div style="display:flex;gap:10px">
+          <button class="btn btn-primary" onclick="startBackup()">💾 Start Backup</button>
+          <button class="btn btn-danger" id="backupCancel" onclick="cancelJob('backupConsole')"
+                  disabled>✕ Cancel</button>
+        </div>
         <div class="terminal" id="backupConsole" style="margin-top:16px"></div>
       </div>
       <div class="card" id="bk-restore" style="display:none">
@@ -280,7 +301,11 @@ HTML = """<!DOCTYPE html>
           <label>Backup archive or directory path</label>
           <input id="restorePath" placeholder="/path/to/backup.tar.gz" />
         </div>
-        <button class="btn btn-primary" onclick="startRestore()">↩️ Start Restore</button>
+        <div style="display:flex;gap:10px">
+          <button class="btn btn-primary" onclick="startRestore()">↩️ Start Restore</button>
+          <button class="btn btn-danger" id="restoreCancel" onclick="cancelJob('restoreConsole')"
+                  disabled>✕ Cancel</button>
+        </div>
         <div class="terminal" id="restoreConsole" style="margin-top:16px"></div>
       </div>
     </div>
@@ -354,7 +379,9 @@ HTML = """<!DOCTYPE html>
 
 <script>
 let currentFlashTarget = 'rom';
-let devicePollTimer;
+const consoleJobs = {};   // console id → ids of the jobs it is following
+let selectedSerial = '';  // '' = first device, 'all' = every device, else one serial
+const jobViews    = {};   // job id → {consoleId, cancelId, progress, cursor}
 
 // ── Navigation ─────────────────────────────────────────────────────────────
 function show(id) {
@@ -378,20 +405,59 @@ async function api(path, body=null) {
 
 // ── Device ─────────────────────────────────────────────────────────────────
 async function pollDevice() {
-  clearTimeout(devicePollTimer);
   try {
-    const d = await api('device');
+    const one = selectedSerial && selectedSerial !== 'all';
+    const d = await api(one ? 'devices/' + encodeURIComponent(selectedSerial) : 'device');
     renderDevice(d);
-    devicePollTimer = setTimeout(pollDevice, 5000);
   } catch(e) {
     document.getElementById('statusLabel').textContent = 'Error';
   }
 }
 
+// Live feed: the server pushes job log lines, progress and device changes
+// over one Server-Sent Events stream. The browser resumes it with
+// Last-Event-ID after a drop, so only events it hasn't seen are sent; a
+// 'reset' means some were lost and state is re-read instead.
+function connectEvents() {
+  const es = new EventSource('/api/events');
+  es.addEventListener('device',   () => { pollDevice(); refreshDevices(); });
+  es.addEventListener('log',      e => onJobLog(JSON.parse(e.data)));
+  es.addEventListener('progress', e => onJobProgress(JSON.parse(e.data)));
+  es.addEventListener('job',      e => onJobStatus(JSON.parse(e.data)));
+  es.addEventListener('reset',    () => {
+    pollDevice(); refreshDevices(); Object.keys(jobViews).forEach(syncJob);
+  });
+  es.onerror = () => { document.getElementById('statusLabel').textContent = 'Reconnecting...'; };
+  es.onopen  = () => { pollDevice(); refreshDevices(); };
+}
+
+// ── Devices (bench) ────────────────────────────────────────────────────────
+async function refreshDevices() {
+  const d   = await api('devices');
+  const sel = document.getElementById('deviceSelect');
+  const opts = [['', 'First device']];
+  if (d.devices.length > 1) opts.push(['all', `All devices (${d.devices.length})`]);
+  d.devices.forEach(x => opts.push([x.serial, `${x.serial} · ${x.mode}`
+    + (x.model !== 'unknown' ? ' · ' + x.model : '') + (x.jobs.length ? ' · busy' : '')]));
+  if (!opts.some(o => o[0] === selectedSerial)) selectedSerial = '';
+  sel.innerHTML = opts.map(([v, t]) => `<option value="${v}">${t}</option>`).join('');
+  sel.value = selectedSerial;
+}
+
+function selectDevice(serial) {
+  selectedSerial = serial;
+  pollDevice();
+}
+
+// API path for an action on the selected device(s): /api/devices/<serial>/<action>
+function devicePath(action) {
+  return selectedSerial ? `devices/${encodeURIComponent(selectedSerial)}/${action}` : action;
+}
+
 function renderDevice(d) {
   const dot   = document.getElementById('statusDot');
   const label = document.getElementById('statusLabel');
-  if (!d || d.mode === 'unknown' || d.serial === 'unknown') {
+  if (!d || d.error || d.mode === 'unknown' || d.serial === 'unknown') {
     dot.className = 'status-dot';
     label.textContent = 'No device';
     document.getElementById('deviceInfo').innerHTML = `
@@ -441,7 +507,7 @@ function renderDevice(d) {
 
 async function rebootDevice(mode) {
   appendLog('device-reboot', `Rebooting to ${mode}...`, 'info');
-  const r = await api('reboot', {mode});
+  const r = await api(devicePath('reboot'), {mode});
   appendLog('device-reboot', r.message, r.ok ? 'success' : 'error');
 }
 
@@ -462,9 +528,9 @@ async function startFlash() {
   appendLog('flashConsole', `Starting flash: ${currentFlashTarget} | ${src}`, 'step');
   showProgress('flashProgressWrap','flashProgressBar','flashProgressLabel','flashProgressPct','Flashing...',0);
 
-  const r = await api('flash', {target: currentFlashTarget, source: src, slot, opts});
-  appendLog('flashConsole', r.message, r.ok ? 'success' : 'error');
-  showProgress('flashProgressWrap','flashProgressBar','flashProgressLabel','flashProgressPct','Done',r.ok?100:0);
+  const r = await api(devicePath('flash'), {target: currentFlashTarget, source: src, slot, opts});
+  followJob(r, 'flashConsole', 'flashCancel',
+            ['flashProgressWrap','flashProgressBar','flashProgressLabel','flashProgressPct']);
 }
 
 // ── Backup ─────────────────────────────────────────────────────────────────
@@ -479,15 +545,93 @@ async function startBackup() {
   const dest  = document.getElementById('backupDest').value;
   const parts = document.getElementById('backupParts').value;
   appendLog('backupConsole', 'Starting backup...', 'step');
-  const r = await api('backup', {dest, partitions: parts ? parts.split(',').map(p=>p.trim()) : null});
-  appendLog('backupConsole', r.message, r.ok ? 'success' : 'error');
+  const r = await api(devicePath('backup'),
+                      {dest, partitions: parts ? parts.split(',').map(p=>p.trim()) : null});
+  followJob(r, 'backupConsole', 'backupCancel');
 }
 
 async function startRestore() {
   const path = document.getElementById('restorePath').value;
+  if (!path) { appendLog('restoreConsole', 'Backup path is required!', 'error'); return; }
+  if (!confirm(`Restore partitions from ${path}? This overwrites them on the device.`)) return;
   appendLog('restoreConsole', `Restoring from ${path}...`, 'step');
-  const r = await api('restore', {path});
-  appendLog('restoreConsole', r.message, r.ok ? 'success' : 'error');
+  const r = await api(devicePath('restore'), {path});
+  followJob(r, 'restoreConsole', 'restoreCancel');
+}
+
+// ── Jobs ───────────────────────────────────────────────────────────────────
+// Flash / backup / restore run as server-side jobs. A console fetches the
+// job's log once, then applies live events newer than its cursor; events
+// that arrive while that fetch is in flight are held until it lands.
+const JOB_LEVELS = {debug:'info', info:'info', success:'success', warning:'warn',
+                    error:'error', critical:'error', step:'step', header:'step'};
+
+// A request on several devices starts one job each; their lines share the
+// console, prefixed with the serial.
+function followJob(r, consoleId, cancelId, progress=null) {
+  appendLog(consoleId, r.message, r.ok ? 'info' : 'error');
+  if (!r.ok) return;
+  const jobs = r.jobs || [r.job];
+  consoleJobs[consoleId] = jobs.map(j => j.id);
+  document.getElementById(cancelId).disabled = false;
+  jobs.forEach(j => {
+    const tag = jobs.length > 1 ? `[${j.params.serial}] ` : '';
+    jobViews[j.id] = {consoleId, cancelId, progress: tag ? null : progress, tag,
+                      cursor: 0, held: []};
+    syncJob(j.id);
+  });
+}
+
+async function syncJob(jobId) {
+  const v = jobViews[jobId];
+  v.held = v.held || [];
+  const s = await api(`jobs/${jobId}?since=${v.cursor}`);
+  if (s.error) { appendLog(v.consoleId, s.error, 'error'); return; }
+  const held = v.held;
+  v.held = null;
+  s.entries.forEach(e => onJobLog({job: jobId, ...e}));
+  if (s.job.progress) onJobProgress({job: jobId, ...s.job.progress});
+  onJobStatus(s.job);
+  held.forEach(f => f());
+}
+
+// true when the event was held back for the view's pending sync
+function held(v, f) {
+  if (v.held) v.held.push(f);
+  return !!v.held;
+}
+
+function onJobLog(d) {
+  const v = jobViews[d.job];
+  if (!v || held(v, () => onJobLog(d)) || d.seq <= v.cursor) return;
+  v.cursor = d.seq;
+  appendLog(v.consoleId, v.tag + d.message, JOB_LEVELS[d.level] || 'info');
+}
+
+function onJobProgress(d) {
+  const v = jobViews[d.job];
+  if (!v || !v.progress || held(v, () => onJobProgress(d))) return;
+  v.fraction = d.fraction || 0;
+  showProgress(...v.progress, d.desc, Math.round(v.fraction * 100));
+}
+
+function onJobStatus(job) {
+  const v = jobViews[job.id];
+  if (!v || held(v, () => onJobStatus(job)) || ['queued','running'].includes(job.status)) return;
+  delete jobViews[job.id];
+  appendLog(v.consoleId, v.tag + job.message, job.status === 'done' ? 'success' : 'error');
+  if (v.progress) showProgress(...v.progress, job.status === 'done' ? 'Done' : job.message,
+                               job.status === 'done' ? 100 : Math.round((v.fraction || 0) * 100));
+  const left = (consoleJobs[v.consoleId] || []).filter(id => id !== job.id);
+  consoleJobs[v.consoleId] = left;
+  if (!left.length) document.getElementById(v.cancelId).disabled = true;
+}
+
+async function cancelJob(consoleId) {
+  for (const jobId of consoleJobs[consoleId] || []) {
+    const r = await api(`jobs/${jobId}/cancel`, {});
+    appendLog(consoleId, r.message, r.ok ? 'warn' : 'error');
+  }
 }
 
 // ── Unlock ─────────────────────────────────────────────────────────────────
@@ -530,7 +674,7 @@ async function refreshLogs() {
 
 async function clearLogs() {
   if (!confirm('Clear all session logs?')) return;
-  await api('clear-logs');
+  await api('clear-logs', {});
   refreshLogs();
 }
 
@@ -576,14 +720,88 @@ function showProgress(wrapId, barId, labelId, pctId, label, pct) {
 }
 
 // ── Init ──────────────────────────────────────────────────────────────────
-pollDevice();
+connectEvents();
 </script>
 </body>
 </html>"""
 
 
+# ─── Encoded responses ───────────────────────────────────────────────────────
+
+GZIP_MIN = 1024   # JSON bodies smaller than this go out uncompressed
+
+
+def _etag(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+class _Asset:
+    """
+    A static response encoded once: identity, gzip and (when the brotli module
+    is installed) br bytes, each with its own strong ETag.
+    """
+
+    def __init__(self, body: bytes, content_type: str):
+        self.content_type = content_type
+        tag = _etag(body)[1:-1]
+        self.variants = {"identity": (body, f'"{tag}"'),
+                         "gzip":     (gzip.compress(body, 9, mtime=0), f'"{tag}-gz"')}
+        if HAS_BROTLI:
+            self.variants["br"] = (brotli.compress(body), f'"{tag}-br"')
+
+
+INDEX = _Asset(HTML.encode(), "text/html; charset=utf-8")
+
+
+def _accepted(header: str) -> set:
+    """Content codings an Accept-Encoding header allows (q=0 excluded, bad q taken as 1)."""
+    codings = set()
+    for part in (header or "").split(","):
+        name, _, params = part.strip().partition(";")
+        q = params.strip()
+        try:
+            weight = float(q[2:] or 0) if q.startswith("q=") else 1.0
+        except ValueError:
+            weight = 1.0
+        if name and weight != 0:
+            codings.add(name.strip().lower())
+    return codings
+
+
 # ─── API Handler ─────────────────────────────────────────────────────────────
 
+WATCHER = None   # DeviceWatcher shared by every request, started in run_gui()
+JOBS    = None   # JobManager running flash / backup / restore, created in run_gui()
+BUS     = None   # EventBus feeding /api/events
+HOSTS   = None   # Host header values the GUI answers POSTs under (None: any), set in run_gui()
+LOOPBACK = ("localhost", "127.0.0.1", "::1")
+
+
+def _job_params(kind: str, body: dict) -> dict:
+    """JobManager.submit() parameters for a flash / backup / restore request body."""
+    if kind == "flash":
+        opts = body.get("opts", "")
+        return {"target": body.get("target", "rom"), "source": (body.get("source") or "").strip(),
+                "slot": body.get("slot") or None,
+                "keep_data": opts == "keep-data", "wipe_data": opts == "wipe-data"}
+    if kind == "backup":
+        return {"out_dir": body.get("dest") or None, "partitions": body.get("partitions") or None}
+    return {"path": (body.get("path") or "").strip()}
+
+
+def _serials(spec: str) -> list:
+    """Serials named in a /api/devices/<spec>/... route: one, a comma list, or "all"."""
+    if spec == "all":
+        return sorted(WATCHER.devices())
+    return [s for s in unquote(spec).split(",") if s]
+
+
+def _quiet_log():
+    from core.logger import Logger
+    log = Logger(); log.no_color = True
+    return log
+
+
 def _run(cmd):
     try:
         r = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
@@ -594,34 +812,140 @@ def _run(cmd):
 
 class APIHandler(BaseHTTPRequestHandler):
 
+    SSE_PING = 15   # seconds between keep-alive comments on /api/events
+
     def log_message(self, *args):
         pass  # Suppress default HTTP logs
 
     def _json(self, data, code=200):
         body = json.dumps(data).encode()
+        if self.command != "GET" or code != 200:
+            self._send(code, body, "application/json", cache="no-store")
+            return
+        # GET: strong ETag so an unchanged /api/device or /api/config is a 304
+        tag = _etag(body)
+        if len(body) >= GZIP_MIN and "gzip" in _accepted(self.headers.get("Accept-Encoding")):
+            self._send(200, gzip.compress(body, 6), "application/json",
+                       etag=tag[:-1] + '-gz"', encoding="gzip")
+        else:
+            self._send(200, body, "application/json", etag=tag)
+
+    def _asset(self, asset: _Asset):
+        accepted = _accepted(self.headers.get("Accept-Encoding"))
+        coding   = next((c for c in ("br", "gzip") if c in asset.variants and c in accepted),
+                        "identity")
+        body, tag = asset.variants[coding]
+        self._send(200, body, asset.content_type, etag=tag,
+                   encoding=None if coding == "identity" else coding)
+
+    def _send(self, code, body, content_type, etag=None, encoding=None, cache="no-cache"):
+        """
+        Send one response. `no-cache` lets the browser keep it but revalidate
+        every time: a matching If-None-Match gets a bodiless 304.
+        """
+        match = self.headers.get("If-None-Match", "")
+        if etag and (match.strip() == "*" or etag in
+                     (t.strip().removeprefix("W/") for t in match.split(","))):
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", cache)
+            self.send_header("Vary", "Accept-Encoding")
+            self.end_headers()
+            return
         self.send_response(code)
-        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Type", content_type)
         self.send_header("Content-Length", len(body))
+        self.send_header("Cache-Control", cache)
+        if etag:
+            self.send_header("ETag", etag)
+            self.send_header("Vary", "Accept-Encoding")
+        if encoding:
+            self.send_header("Content-Encoding", encoding)
         self.end_headers()
         self.wfile.write(body)
 
+    def _submit(self, kind, **params):
+        try:
+            job = JOBS.submit(kind, **params)
+        except ValueError as e:
+            self._json({"ok": False, "message": str(e)}); return
+        self._json({"ok": True, "job": job.to_dict(), "message": f"Job {job.id} started"})
+
+    def _device_action(self, serials, action, body):
+        """POST /api/devices/<serials>/<action>: the same action on every listed device."""
+        if not serials:
+            self._json({"ok": False, "message": "No devices"}); return
+
+        if action == "reboot":
+            from concurrent.futures import ThreadPoolExecutor
+            from core.device import DeviceManager
+            mode = body.get("mode", "system")
+            with ThreadPoolExecutor(max_workers=min(len(serials), 8)) as pool:
+                results = dict(zip(serials, pool.map(
+                    lambda s: DeviceManager(_quiet_log(), s).reboot(mode), serials)))
+            done = [s for s, ok in results.items() if ok]
+            self._json({"ok": len(done) == len(serials), "results": results,
+                        "message": f"Reboot → {mode} sent to {len(done)}/{len(serials)} device(s)"})
+            return
+
+        if action not in ("flash", "backup", "restore"):
+            self._json({"error": "Unknown endpoint"}, 404); return
+        params = _job_params(action, body)
+        per_device = []
+        for s in serials:
+            p = {**params, "serial": s}
+            if action == "backup" and p["out_dir"] and len(serials) > 1:
+                p["out_dir"] = os.path.join(p["out_dir"], s.replace(":", "_"))   # one dir each
+            per_device.append(p)
+        try:
+            jobs = [JOBS.submit(action, **p) for p in per_device]
+        except ValueError as e:
+            self._json({"ok": False, "message": str(e)}); return
+        self._json({"ok": True, "jobs": [j.to_dict() for j in jobs],
+                    "message": f"Started {action} job(s) " + ", ".join(
+                        f"{j.id} ({j.params['serial']})" for j in jobs)})
+
+    def _events(self):
+        """
+        Server-Sent Events: job log / progress / status and device changes.
+        Resumes after the browser's Last-Event-ID (or ?since=N); a fresh
+        client starts at the current event and gets a 'hello' with its id.
+        """
+        q      = parse_qs(urlparse(self.path).query)
+        resume = self.headers.get("Last-Event-ID") or q.get("since", [""])[0]
+        cursor = int(resume) if resume.isdigit() else BUS.cursor
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("X-Accel-Buffering", "no")
+        self.end_headers()
+        out = [] if resume else [f"id: {cursor}\nevent: hello\ndata: {{}}\n\n"]
+        try:
+            while True:
+                if out:
+                    self.wfile.write("".join(out).encode())
+                    self.wfile.flush()
+                cursor, events, missed = BUS.wait(cursor, timeout=self.SSE_PING)
+                if missed:
+                    out = [f"id: {cursor}\nevent: reset\ndata: {{}}\n\n"]
+                elif events:
+                    out = [f"id: {e.id}\nevent: {e.kind}\ndata: {json.dumps(e.data)}\n\n"
+                           for e in events]
+                else:
+                    out = [": ping\n\n"]   # keeps proxies and dead-peer detection going
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
     def do_GET(self):
         path = urlparse(self.path).path
         if path == "/" or path == "/index.html":
-            body = HTML.encode()
-            self.send_response(200)
-            self.send_header("Content-Type", "text/html")
-            self.send_header("Content-Length", len(body))
-            self.end_headers()
-            self.wfile.write(body)
+            self._asset(INDEX)
             return
 
         if path == "/api/device":
             from core.device import DeviceManager
-            from core.logger import Logger
-            log = Logger(); log.no_color = True
-            dm  = DeviceManager(log)
-            info = dm.detect()
+            dm   = DeviceManager(_quiet_log())
+            info = dm.detect(refresh="refresh" in parse_qs(urlparse(self.path).query))
             if info:
                 from dataclasses import asdict
                 self._json(asdict(info))
@@ -629,17 +953,84 @@ class APIHandler(BaseHTTPRequestHandler):
                 self._json({"mode":"unknown","serial":"unknown"})
             return
 
+        if path == "/api/devices":
+            # every attached device: watcher's list + DeviceCache details + its active jobs
+            from dataclasses import asdict
+            from core.device import DeviceManager
+            active = {}
+            for job in JOBS.jobs():
+                if job.status in ("queued", "running") and job.params.get("serial"):
+                    active.setdefault(job.params["serial"], []).append(job.id)
+            infos = DeviceManager(_quiet_log()).inventory(sorted(WATCHER.devices().items()))
+            self._json({"devices": [{**asdict(i), "jobs": active.get(i.serial, [])}
+                                    for i in infos]})
+            return
+
+        if path.startswith("/api/devices/"):
+            from dataclasses import asdict
+            from core.device import DeviceManager
+            serial = unquote(path[len("/api/devices/"):])
+            info   = DeviceManager(_quiet_log(), serial).detect(
+                refresh="refresh" in parse_qs(urlparse(self.path).query))
+            if not info:
+                self._json({"error": f"Device not found: {serial}"}, 404); return
+            self._json(asdict(info))
+            return
+
+        if path == "/api/watch":
+            from dataclasses import asdict
+            try:
+                since = int(parse_qs(urlparse(self.path).query).get("since", ["0"])[0] or 0)
+            except ValueError:
+                self._json({"error": "since must be an integer"}, 400); return
+            seq, events = WATCHER.since(since)
+            self._json({"seq": seq, "devices": WATCHER.devices(),
+                        "events": [asdict(e) for e in events]})
+            return
+
         if path == "/api/logs":
-            import glob
-            log_dir = os.path.expanduser("~/.local/share/miflasher/logs")
+            # ?session=ID&level=error,warning&since=<unix>&until=<unix>&limit=N
+            from core.session import SessionStore
+            q = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+            try:
+                limit = int(q.get("limit", 200))
+                since = float(q["since"]) if "since" in q else None
+                until = float(q["until"]) if "until" in q else None
+            except ValueError:
+                self._json({"error": "limit must be an integer, since / until unix times"}, 400)
+                return
+            store   = SessionStore()
+            sid     = q.get("session") or store.latest()
+            levels  = [l for l in q.get("level", "").split(",") if l] or None
             entries = []
-            files   = sorted(glob.glob(os.path.join(log_dir, "*.jsonl")), reverse=True)
-            if files:
-                with open(files[0]) as f:
-                    for line in f:
-                        try: entries.append(json.loads(line))
-                        except: pass
-            self._json({"entries": entries[-200:]})
+            if sid and os.path.exists(store.path(sid)):
+                if "level" in q or "since" in q or "until" in q:
+                    entries = store.query(sid, levels=levels, since=since, until=until,
+                                          limit=limit)
+                else:
+                    entries = store.tail(sid, limit)
+            self._json({"session": sid, "entries": entries})
+            return
+
+        if path == "/api/events":
+            self._events()
+            return
+
+        if path == "/api/jobs":
+            self._json({"jobs": [j.to_dict() for j in JOBS.jobs()]})
+            return
+
+        if path.startswith("/api/jobs/"):
+            # /api/jobs/<id>?since=<cursor> → status + log lines after the cursor
+            job = JOBS.get(path[len("/api/jobs/"):])
+            if not job:
+                self._json({"error": "Unknown job"}, 404); return
+            try:
+                since = int(parse_qs(urlparse(self.path).query).get("since", ["0"])[0] or 0)
+            except ValueError:
+                self._json({"error": "since must be an integer"}, 400); return
+            cursor, entries = JOBS.entries(job.id, since)
+            self._json({"job": job.to_dict(), "cursor": cursor, "entries": entries})
             return
 
         if path == "/api/config":
@@ -649,31 +1040,56 @@ class APIHandler(BaseHTTPRequestHandler):
 
         self._json({"error": "Not found"}, 404)
 
+    def _same_origin(self) -> bool:
+        """
+        A POST from the GUI page itself. Other sites can't send an
+        application/json body without a CORS preflight, which is never
+        granted; the Host / Origin checks also turn away DNS rebinding.
+        """
+        ctype = self.headers.get("Content-Type", "").split(";")[0].strip().lower()
+        host  = self.headers.get("Host", "").lower()
+        if ctype != "application/json" or (HOSTS is not None and host not in HOSTS):
+            return False
+        origin = self.headers.get("Origin")
+        return origin is None or origin.lower() == f"http://{host}"
+
     def do_POST(self):
-        path   = urlparse(self.path).path
-        length = int(self.headers.get("Content-Length", 0))
-        body   = json.loads(self.rfile.read(length) or b"{}")
+        path = urlparse(self.path).path
+        if not self._same_origin():
+            self._json({"error": "Cross-origin or non-JSON request refused"}, 403)
+            return
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            if length < 0:
+                raise ValueError(length)
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._json({"error": "Malformed Content-Length or JSON body"}, 400)
+            return
+        if not isinstance(body, dict):
+            self._json({"error": "JSON body must be an object"}, 400)
+            return
 
         if path == "/api/reboot":
+            # adb or fastboot reboot, whichever the device's mode needs
+            from core.device import DeviceManager
             mode = body.get("mode", "system")
-            ok, out = _run(["adb", "reboot", mode])
-            if not ok:
-                ok, out = _run(["fastboot", "reboot"])
-            self._json({"ok": ok, "message": out or f"Reboot → {mode} sent"})
+            ok   = DeviceManager(_quiet_log(), body.get("serial") or None).reboot(mode)
+            self._json({"ok": ok, "message": f"Reboot → {mode} sent" if ok else "Reboot failed"})
 
-        elif path == "/api/flash":
-            # Async placeholder — real implementation would stream output
-            self._json({"ok": False, "message":
-                "Flash started in background. Check CLI for output. "
-                "GUI flash streaming coming in next version."})
+        elif path in ("/api/flash", "/api/backup", "/api/restore"):
+            kind = path[len("/api/"):]
+            self._submit(kind, **_job_params(kind, body))
 
-        elif path == "/api/backup":
-            self._json({"ok": False, "message":
-                "Run: miflasher backup --all from terminal for full backup."})
+        elif path.startswith("/api/devices/") and path.count("/") == 4:
+            spec, action = path[len("/api/devices/"):].split("/")
+            self._device_action(_serials(spec), action, body)
 
-        elif path == "/api/restore":
-            self._json({"ok": False, "message":
-                "Run: miflasher restore --path <file> from terminal."})
+        elif path.startswith("/api/jobs/") and path.endswith("/cancel"):
+            job_id = path[len("/api/jobs/"):-len("/cancel")]
+            ok = JOBS.cancel(job_id)
+            self._json({"ok": ok, "message": f"Cancelling job {job_id}" if ok
+                        else f"Job {job_id} is not running"})
 
         elif path == "/api/unlock":
             self._json({"ok": False, "message":
@@ -709,11 +1125,32 @@ class APIHandler(BaseHTTPRequestHandler):
 # ─── Entrypoint ───────────────────────────────────────────────────────────────
 
 def run_gui(host: str = "localhost", port: int = 8080, open_browser: bool = True):
+    global WATCHER, JOBS, BUS, HOSTS
+    from dataclasses import asdict
+    from core.logger import Logger
+    from core.device import DeviceCache
+    from core.events import EventBus
+    from core.jobs import JobManager
+    from core.watch import DeviceWatcher
+    log = Logger(); log.no_color = True
+    BUS     = EventBus()
+    WATCHER = DeviceWatcher(log)
+    DeviceCache.follow(WATCHER)
+    WATCHER.subscribe(lambda ev: BUS.publish("device",
+                                             {**asdict(ev), "devices": WATCHER.devices()}))
+    WATCHER.start()
+    JOBS = JobManager(on_event=BUS.publish)
+
+    names = [f"[{n}]" if ":" in n else n for n in (LOOPBACK if host in LOOPBACK else (host,))]
+    HOSTS = None if host in ("", "0.0.0.0", "::") else (
+        {f"{n}:{port}" for n in names} | (set(names) if port == 80 else set()))
+
     url = f"http://{host}:{port}"
     print(f"\n  \033[1;36m🌐 MiFlasher GUI running at {url}\033[0m")
     print(f"  \033[2mPress Ctrl+C to stop\033[0m\n")
 
-    server = HTTPServer((host, port), APIHandler)
+    server = ThreadingHTTPServer((host, port), APIHandler)
+    server.daemon_threads = True   # a hung request never blocks shutdown
 
     if open_browser:
         threading.Timer(0.8, lambda: webbrowser.open(url)).start()
@@ -723,3 +1160,5 @@ def run_gui(host: str = "localhost", port: int = 8080, open_browser: bool = True
     except KeyboardInterrupt:
         print("\n  \033[1;33m⚡ GUI stopped.\033[0m")
         server.shutdown()
+        JOBS.shutdown()
+        WATCHER.stop()